@@ -0,0 +1,134 @@
+"""Tween scheduling for the water sort game's animations.
+
+``AnimationScheduler`` runs any number of concurrent tweens - pours, points
+popups, selection pulses - off one clock.  Tween records come from a
+preallocated pool and go back to it when they finish, and the active list
+removes entries by swapping the last one into their place, so starting,
+finishing and cancelling are all O(1) and a busy frame allocates nothing.
+It does not depend on pygame; the game passes its clock in.
+
+``update`` is meant for a fixed-step simulation: it is what moves tweens on
+and retires the finished ones.  Between two steps a renderer can ``sample``
+the tweens at any time to draw them without changing what is running.
+
+Curved paths are sampled once into a table: ``quadratic_arc`` turns three
+control points into ``ARC_STEPS + 1`` pixel positions using the Bezier
+weights precomputed in ``QUADRATIC_WEIGHTS``, so following the curve during
+a tween is a table lookup.
+"""
+
+
+def linear(t):
+    return t
+
+
+def ease_out_quad(t):
+    return t * (2 - t)
+
+
+def ease_out_cubic(t):
+    t -= 1
+    return t * t * t + 1
+
+
+def ease_in_out_cubic(t):
+    if t < 0.5:
+        return 4 * t * t * t
+    t = 2 * t - 2
+    return t * t * t / 2 + 1
+
+
+ARC_STEPS = 128
+
+# Bernstein weights of a quadratic Bezier at ARC_STEPS + 1 evenly spaced t
+QUADRATIC_WEIGHTS = tuple(((1 - t) ** 2, 2 * (1 - t) * t, t * t) for t in (i / ARC_STEPS for i in range(ARC_STEPS + 1)))
+
+
+def quadratic_arc(start, control, end):
+    """Integer pixel positions along a quadratic Bezier, one per QUADRATIC_WEIGHTS entry"""
+    (x0, y0), (x1, y1), (x2, y2) = start, control, end
+    return [(round(a * x0 + b * x1 + c * x2), round(a * y0 + b * y1 + c * y2)) for a, b, c in QUADRATIC_WEIGHTS]
+
+
+class Tween:
+    """One running animation; records are reused, so don't keep them after they finish"""
+    __slots__ = ('kind', 'payload', 'start', 'duration', 'easing', 't', 'value', 'slot')
+
+    def __init__(self):
+        self.kind = None
+        self.payload = None # What to draw, e.g. (from, to, segments, color) for a pour
+        self.start = 0
+        self.duration = 1
+        self.easing = linear
+        self.t = 0.0 # Raw progress, 0 to 1
+        self.value = 0.0 # Eased progress
+        self.slot = -1 # Position in AnimationScheduler.active
+
+
+class AnimationScheduler:
+    def __init__(self, clock, pool_size=64):
+        self.clock = clock # Milliseconds; every tween is timed from this
+        self.now = clock()
+        self.active = []
+        # Free records; the pool only grows if more tweens run at once than it holds
+        self.pool = [Tween() for _ in range(pool_size)]
+
+    def __len__(self):
+        return len(self.active)
+
+    def start(self, kind, duration, payload=None, easing=linear):
+        """Start a tween now and return its record"""
+        tween = self.pool.pop() if self.pool else Tween()
+        tween.kind = kind
+        tween.payload = payload
+        tween.start = self.clock()
+        tween.duration = duration
+        tween.easing = easing
+        tween.t = tween.value = 0.0
+        tween.slot = len(self.active)
+        self.active.append(tween)
+        return tween
+
+    def remove(self, tween):
+        """Stop a tween; the last active one takes its slot"""
+        last = self.active.pop()
+        if last is not tween:
+            self.active[tween.slot] = last
+            last.slot = tween.slot
+        tween.slot = -1
+        tween.payload = None
+        self.pool.append(tween)
+
+    def update(self, now=None):
+        """Advance every tween to ``now`` (the clock by default) and retire finished ones"""
+        self.now = self.clock() if now is None else now
+        active = self.active
+        # Backwards, so a swap-remove only moves an already updated tween
+        for i in range(len(active) - 1, -1, -1):
+            tween = active[i]
+            t = (self.now - tween.start) / tween.duration
+            if t >= 1:
+                self.remove(tween)
+                continue
+            tween.t = t if t > 0 else 0.0
+            tween.value = tween.easing(tween.t)
+
+    def sample(self, now):
+        """Set every tween's progress at ``now`` for drawing, without retiring any.
+
+        A tween that has run its course by ``now`` holds at its end until the
+        next ``update`` retires it.
+        """
+        for tween in self.active:
+            t = (now - tween.start) / tween.duration
+            tween.t = 0.0 if t < 0 else 1.0 if t > 1 else t
+            tween.value = tween.easing(tween.t)
+
+    def count(self, kind):
+        return sum(1 for tween in self.active if tween.kind == kind)
+
+    def cancel(self, kind=None):
+        """Stop every tween, or every tween of one kind"""
+        for i in range(len(self.active) - 1, -1, -1):
+            if kind is None or self.active[i].kind == kind:
+                self.remove(self.active[i])
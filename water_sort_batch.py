@@ -0,0 +1,139 @@
+"""Vectorised simulator that steps many water sort boards at once.
+
+``N`` boards are held in one ``(N, bottles, capacity)`` uint8 array.  Cells are
+listed bottom first like ``Board``; ``0`` is an empty cell and colour ``c`` is
+stored as ``c + 1``.  Every operation here follows the same rules as
+``GameCore.pour_liquid``, ``GameCore.complete_pour`` and
+``GameCore.check_win_condition``.  All bottles must have the same capacity;
+boards with mixed sizes are rejected.
+
+This module needs NumPy; the rest of the game does not.
+"""
+import numpy as np
+
+from water_sort_board import Board
+from water_sort_core import SCORE_MULTIPLIERS
+
+
+def from_boards(boards):
+    """Pack a list of equally sized ``Board`` objects into a state array"""
+    num_bottles, capacity = len(boards[0]), boards[0].capacity
+    if capacity is None:
+        raise ValueError("the batch simulator needs boards whose bottles all have one capacity")
+    states = np.zeros((len(boards), num_bottles, capacity), dtype=np.uint8)
+    for n, board in enumerate(boards):
+        for i in range(num_bottles):
+            content = board.contents(i)
+            states[n, i, :len(content)] = np.asarray(content, dtype=np.uint8) + 1
+    return states
+
+
+def to_board(state):
+    """Unpack one ``(bottles, capacity)`` slice of a state array into a ``Board``"""
+    contents = [[int(cell) - 1 for cell in bottle if cell] for bottle in state]
+    return Board.from_contents(contents, state.shape[1])
+
+
+def heights(states):
+    return np.count_nonzero(states, axis=2)
+
+
+def top_colors(states, fill=None):
+    """Stored top colour of every bottle, 0 for empty bottles"""
+    if fill is None:
+        fill = heights(states)
+    top = np.take_along_axis(states, np.maximum(fill - 1, 0)[..., None], axis=2)[..., 0]
+    return np.where(fill > 0, top, 0)
+
+
+def top_runs(states, fill=None, tops=None):
+    """Length of the run of equal colours at the top of every bottle"""
+    if fill is None:
+        fill = heights(states)
+    if tops is None:
+        tops = top_colors(states, fill)
+    capacity = states.shape[2]
+    # Walk down from the top: depth d looks at cell fill - 1 - d
+    positions = fill[..., None] - 1 - np.arange(capacity)
+    cells = np.take_along_axis(states, np.maximum(positions, 0), axis=2)
+    matches = (positions >= 0) & (cells == tops[..., None])
+    return np.cumprod(matches, axis=2).sum(axis=2)
+
+
+def pour_amounts(states):
+    """``(N, bottles, bottles)`` segments each pour would move, 0 where illegal"""
+    capacity = states.shape[2]
+    fill = heights(states)
+    tops = top_colors(states, fill)
+    runs = top_runs(states, fill, tops)
+    free = capacity - fill
+
+    src_ok = (fill > 0)[:, :, None]
+    dst_ok = (free > 0)[:, None, :]
+    # Can't mix different colors
+    colors_ok = (fill == 0)[:, None, :] | (tops[:, :, None] == tops[:, None, :])
+    legal = src_ok & dst_ok & colors_ok
+    legal[:, np.arange(states.shape[1]), np.arange(states.shape[1])] = False
+
+    amounts = np.minimum(runs[:, :, None], free[:, None, :])
+    return np.where(legal, amounts, 0)
+
+
+def legal_moves(states):
+    """``(N, bottles, bottles)`` mask of allowed (from, to) pours"""
+    return pour_amounts(states) > 0
+
+
+def complete_bottles(states):
+    """``(N, bottles)`` mask of bottles that are full of a single colour"""
+    return (states[:, :, :1] != 0).squeeze(2) & np.all(states == states[:, :, :1], axis=2)
+
+
+def is_solved(states):
+    """``(N,)`` mask of boards where every bottle is empty or complete"""
+    empty = ~np.any(states, axis=2)
+    return np.all(empty | complete_bottles(states), axis=1)
+
+
+def apply_pours(states, from_indices, to_indices):
+    """Pour ``from_indices[n]`` into ``to_indices[n]`` on every board, in place.
+
+    Illegal pours leave their board untouched.  Returns the ``(N,)`` segments
+    moved on each board and the ``(N,)`` solved flags after the pours.
+    """
+    boards = np.arange(states.shape[0])
+    from_indices = np.asarray(from_indices)
+    to_indices = np.asarray(to_indices)
+    capacity = states.shape[2]
+
+    fill = heights(states)
+    tops = top_colors(states, fill)
+    runs = top_runs(states, fill, tops)
+    from_fill = fill[boards, from_indices]
+    to_fill = fill[boards, to_indices]
+    from_top = tops[boards, from_indices]
+    to_top = tops[boards, to_indices]
+
+    legal = (from_indices != to_indices) & (from_fill > 0) & (to_fill < capacity)
+    legal &= (to_fill == 0) | (to_top == from_top)
+    amounts = np.where(legal, np.minimum(runs[boards, from_indices], capacity - to_fill), 0)
+
+    # The poured run is a single colour, so cells can move in any order
+    for depth in range(capacity):
+        moving = boards[amounts > depth]
+        if not len(moving): break
+        src = from_indices[moving]
+        dst = to_indices[moving]
+        src_cell = from_fill[moving] - 1 - depth
+        states[moving, dst, to_fill[moving] + depth] = states[moving, src, src_cell]
+        states[moving, src, src_cell] = 0
+
+    return amounts, is_solved(states)
+
+
+def pour_points(amounts, level):
+    """Points ``GameCore.update_score`` would award for each pour in ``amounts``"""
+    amounts = np.asarray(amounts)
+    multiplier = SCORE_MULTIPLIERS.get(level, 1)
+    bonus = np.where(amounts > 1, amounts * 5, 0)
+    return np.where(amounts > 0, np.round(10 * amounts * multiplier + bonus), 0).astype(np.int64)
@@ -0,0 +1,205 @@
+"""Throughput benchmarks for the rules layer of the water sort game.
+
+Measures ``GameCore`` without pygame: pours per second through
+``pour_liquid`` and ``complete_pour``, ``show_hint`` latency as the number of
+bottles grows, the cost of ``check_win_condition`` and how many boards per
+second ``initialize_game`` deals for each level preset.  Large custom boards
+get their own section: generation time and hint latency both on the dealt
+solution path and after a few random pours have left it.
+
+Results are printed as one JSON document (or written with ``--output``) so
+runs can be stored and scaling curves compared over time:
+
+    python water_sort_bench_logic.py --output logic.json
+    python water_sort_bench_logic.py --sizes 5 9 13 17 --hint-boards 10
+    python water_sort_bench_logic.py --custom-sizes 30 100 --custom-boards 5
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+from water_sort_board import Board
+from water_sort_core import LEVELS, GameCore
+from water_sort_generator import deal, generate_board
+from water_sort_solver import legal_moves
+
+SEED = 1234
+DEFAULT_SIZES = [5, 7, 9, 11, 13, 16] # Bottles per hint board, two of them empty
+DEFAULT_CUSTOM_SIZES = [30, 60, 100]
+OFF_PATH_POURS = 3 # Random pours that take a large board off its solution path
+
+
+def quiet():
+    # GameCore reports misuse with print(); keep it out of the JSON output
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def percentiles(samples):
+    values = sorted(samples)
+    def at(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+    return {'p50': at(0.50), 'p95': at(0.95), 'max': values[-1]}
+
+
+def bench_pours(level, repeats):
+    """Pours per second replaying a solution with pour_liquid and complete_pour"""
+    board, solution = generate_board(level, SEED)
+    core = GameCore(level, SEED)
+    core.start_game()
+
+    # pour_liquid works out the amount; complete_pour is given it
+    amounts = []
+    replay = board.copy()
+    for from_index, to_index in solution:
+        amounts.append(replay.pour_amount(from_index, to_index))
+        replay.pour(from_index, to_index, amounts[-1])
+    moves = [(f, t, n) for (f, t), n in zip(solution, amounts)]
+
+    pour_liquid = core.pour_liquid
+    elapsed = 0.0
+    for _ in range(repeats):
+        core.board = board.copy()
+        start = time.perf_counter()
+        for from_index, to_index in solution:
+            pour_liquid(from_index, to_index)
+        elapsed += time.perf_counter() - start
+    pour_rate = repeats * len(solution) / elapsed
+
+    complete_pour = core.complete_pour
+    elapsed = 0.0
+    for _ in range(repeats):
+        core.board = board.copy()
+        start = time.perf_counter()
+        for from_index, to_index, segments in moves:
+            complete_pour(from_index, to_index, segments)
+        elapsed += time.perf_counter() - start
+    complete_rate = repeats * len(solution) / elapsed
+
+    return {'pour_liquid_per_sec': round(pour_rate), 'complete_pour_per_sec': round(complete_rate)}
+
+
+def bench_check_win(level, calls):
+    """Nanoseconds per check_win_condition call on a dealt and on a solved board"""
+    board, solution = generate_board(level, SEED)
+    core = GameCore(level, SEED)
+    core.board = board.copy()
+    result = {}
+
+    for label in ('unsolved', 'solved'):
+        if label == 'solved':
+            for from_index, to_index in solution:
+                core.board.pour(from_index, to_index, core.board.pour_amount(from_index, to_index))
+        check = core.check_win_condition
+        start = time.perf_counter()
+        for _ in range(calls):
+            check()
+        result[f'{label}_ns'] = round((time.perf_counter() - start) * 1e9 / calls)
+    return result
+
+
+def bench_hint(num_bottles, boards):
+    """show_hint latency in milliseconds on freshly dealt boards of one size"""
+    core = GameCore()
+    core.start_game()
+    rng = random.Random(SEED)
+    samples = []
+    found = 0
+    for _ in range(boards):
+        core.board = Board.from_contents(deal(num_bottles, num_bottles - 2, rng))
+        start = time.perf_counter()
+        with quiet():
+            hint = core.show_hint()
+        samples.append((time.perf_counter() - start) * 1000)
+        found += hint is not None
+
+    result = {'bottles': num_bottles, 'boards': boards, 'hinted': found}
+    result.update((name, round(ms, 3)) for name, ms in percentiles(samples).items())
+    return result
+
+
+def bench_generation(level, games):
+    """Boards per second dealt and verified by initialize_game"""
+    core = GameCore(level, SEED)
+    start = time.perf_counter()
+    for seed in range(games):
+        core.initialize_game(seed)
+    elapsed = time.perf_counter() - start
+    return {'boards_per_sec': round(games / elapsed, 1), 'ms_per_board': round(elapsed * 1000 / games, 3)}
+
+
+def bench_large(num_bottles, boards):
+    """Generation time and hint latency in milliseconds on custom boards of one size"""
+    core = GameCore('custom', custom_bottles=num_bottles)
+    rng = random.Random(SEED)
+    generation, on_path, off_path = [], [], []
+    hinted = 0
+    for seed in range(boards):
+        start = time.perf_counter()
+        core.initialize_game(seed)
+        generation.append((time.perf_counter() - start) * 1000)
+        core.start_game()
+
+        start = time.perf_counter()
+        core.show_hint()
+        on_path.append((time.perf_counter() - start) * 1000)
+
+        for _ in range(OFF_PATH_POURS):
+            moves = list(legal_moves(core.board))
+            if moves:
+                core.pour_liquid(*rng.choice(moves)[:2])
+        start = time.perf_counter()
+        with quiet():
+            hinted += core.show_hint() is not None
+        off_path.append((time.perf_counter() - start) * 1000)
+
+    def summary(samples):
+        return {name: round(ms, 3) for name, ms in percentiles(samples).items()}
+    return {'bottles': num_bottles, 'boards': boards, 'off_path_hinted': hinted,
+            'generation': summary(generation), 'hint_on_path': summary(on_path), 'hint_off_path': summary(off_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rules-layer throughput benchmarks for the water sort game")
+    parser.add_argument('--levels', nargs='+', default=LEVELS, choices=LEVELS, help="level presets to measure")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="bottle counts for the hint latency curve")
+    parser.add_argument('--hint-boards', type=int, default=20, help="boards dealt per hint size")
+    parser.add_argument('--pour-repeats', type=int, default=2000, help="solution replays per level")
+    parser.add_argument('--win-calls', type=int, default=100000, help="check_win_condition calls per board")
+    parser.add_argument('--games', type=int, default=50, help="boards generated per level")
+    parser.add_argument('--custom-sizes', nargs='+', type=int, default=DEFAULT_CUSTOM_SIZES, help="bottle counts for the large-board section")
+    parser.add_argument('--custom-boards', type=int, default=10, help="boards dealt per large-board size")
+    parser.add_argument('--output', help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'levels': {},
+        'hint_latency_ms': [],
+        'large_boards_ms': [],
+    }
+    for level in args.levels:
+        results['levels'][level] = {
+            'pours': bench_pours(level, args.pour_repeats),
+            'check_win': bench_check_win(level, args.win_calls),
+            'generation': bench_generation(level, args.games),
+        }
+    for num_bottles in args.sizes:
+        results['hint_latency_ms'].append(bench_hint(num_bottles, args.hint_boards))
+    for num_bottles in args.custom_sizes:
+        results['large_boards_ms'].append(bench_large(num_bottles, args.custom_boards))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
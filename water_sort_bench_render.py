@@ -0,0 +1,257 @@
+"""Headless rendering benchmarks for the water sort game.
+
+Runs the real ``WaterSortGame`` drawing path - static layers, ``draw_ui``,
+bottle sprites, the pouring animation and the win modal - off-screen with the
+SDL dummy video driver.  Every scenario scripts the game state for a fixed
+number of frames and goes through ``advance`` and ``render_dirty`` exactly
+like the main loop, so the update steps and the dirty-rect bookkeeping are
+measured too.
+
+For each scenario the frame rate is the best of a few timed passes, and the
+bytes allocated per frame (tracemalloc peak above the frame's starting point)
+are measured in a separate pass, since tracing slows the frames down.  Results are compared with a
+stored baseline; a scenario regresses when its frame rate drops or its
+allocations grow by more than the tolerance, and a missing baseline is an
+error too.
+
+The repository keeps a reference baseline, tagged with the machine and
+Python it was measured on.  Frame rates only compare well on the same
+machine, so ``--update-baseline`` writes a local, untracked baseline that is
+preferred over the reference once it exists.
+
+    python water_sort_bench_render.py                    # compare with the baseline
+    python water_sort_bench_render.py --update-baseline  # store the current numbers locally
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+from water_sort_solver import legal_moves
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GAME_SCRIPT = os.path.join(HERE, 'water_sort_v0.1.13-2.py')
+REFERENCE_BASELINE = os.path.join(HERE, 'bench_render_baseline.json')
+LOCAL_BASELINE = os.path.join(HERE, 'bench_render_baseline.local.json') # Per machine, not committed
+
+SEED = 1234
+POUR_EVERY = 10 # Frames between pours in the continuous pour scenario
+MAX_POINTS_ANIMATIONS = 40
+LARGE_BOTTLES = 100 # Bottles in the large-board scenarios
+TIMING_ROUNDS = 3 # Timed passes per scenario; the fastest counts
+
+
+def load_game_module():
+    # The game script's file name is not importable with a plain import
+    spec = importlib.util.spec_from_file_location('water_sort_game', GAME_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def new_game(module, screen, level='hard'):
+    game = module.WaterSortGame(screen, idle_sleep=False)
+    game.current_level = level
+    game.initialize_game(SEED)
+    game.start_game()
+    game.render_dirty(screen) # Warm the static layers and sprite cache
+    return game
+
+
+# Scenarios: setup(game) runs once, step(game, frame, rng) before every frame
+
+def setup_idle(game):
+    pass
+
+
+def step_idle(game, frame, rng):
+    pass
+
+
+def step_full_redraw(game, frame, rng):
+    game.dirty.mark_all()
+
+
+def step_selection_glow(game, frame, rng):
+    # Toggle the selection glow on a non-empty bottle every frame
+    index = next(i for i in range(len(game.board)) if not game.board.is_empty(i))
+    game.handle_click(game.bottles[index].rect.center if frame % 2 == 0 else (0, 0))
+
+
+def step_pours(game, frame, rng):
+    # Pour a random legal move every few frames so an animation is always running
+    if frame % POUR_EVERY: return
+    moves = [move[:2] for move in legal_moves(game.board)]
+    if not moves or game.check_win_condition():
+        game.initialize_game(SEED)
+        game.start_game()
+        moves = [move[:2] for move in legal_moves(game.board)]
+    game.pour_liquid(*rng.choice(moves))
+
+
+def step_points(game, frame, rng):
+    if game.animations.count('points') < MAX_POINTS_ANIMATIONS:
+        game.update_score(1 + frame % 3)
+
+
+def setup_win_modal(game):
+    game.show_win_modal()
+
+
+def setup_large(game):
+    # Re-deal as a custom board laid out as a grid of scaled bottles
+    game.current_level = 'custom'
+    game.custom_bottles = LARGE_BOTTLES
+    game.initialize_game(SEED)
+    game.start_game()
+    game.render_dirty(game.screen)
+
+
+SCENARIOS = {
+    'idle': (setup_idle, step_idle),
+    'full_redraw': (setup_idle, step_full_redraw),
+    'selection_glow': (setup_idle, step_selection_glow),
+    'continuous_pours': (setup_idle, step_pours),
+    'points_animations': (setup_idle, step_points),
+    'win_modal': (setup_win_modal, step_full_redraw),
+    'large_idle': (setup_large, step_idle),
+    'large_full_redraw': (setup_large, step_full_redraw),
+    'large_selection_glow': (setup_large, step_selection_glow),
+    'large_pours': (setup_large, step_pours),
+}
+
+
+def run_frames(game, screen, step, frames, trace=False):
+    rng = random.Random(SEED)
+    allocated = 0
+    start = time.perf_counter()
+    for frame in range(frames):
+        if trace:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        step(game, frame, rng)
+        game.advance(pygame.time.get_ticks())
+        game.render_dirty(screen)
+        if trace:
+            allocated += tracemalloc.get_traced_memory()[1] - base
+    return time.perf_counter() - start, allocated
+
+
+def run_scenario(module, screen, name, frames, trace_frames):
+    setup, step = SCENARIOS[name]
+
+    game = new_game(module, screen)
+    setup(game)
+    run_frames(game, screen, step, min(frames, 30)) # Warm-up
+    elapsed = min(run_frames(game, screen, step, frames)[0] for _ in range(TIMING_ROUNDS))
+
+    game = new_game(module, screen)
+    setup(game)
+    run_frames(game, screen, step, min(trace_frames, 30))
+    tracemalloc.start()
+    try:
+        _, allocated = run_frames(game, screen, step, trace_frames, trace=True)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'fps': round(frames / elapsed, 1),
+        'ms_per_frame': round(elapsed * 1000 / frames, 4),
+        'alloc_bytes_per_frame': round(allocated / trace_frames),
+    }
+
+
+def machine_info():
+    """What a baseline was measured on; stored under its 'machine' key"""
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human readable regressions against ``baseline``"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        # Small absolute slack so near-zero baselines don't flag noise
+        if result['ms_per_frame'] > base['ms_per_frame'] * (1 + tolerance) + 0.05:
+            regressions.append(f"{name}: {result['fps']} fps, baseline {base['fps']}")
+        if result['alloc_bytes_per_frame'] > base['alloc_bytes_per_frame'] * (1 + tolerance) + 256:
+            regressions.append(f"{name}: {result['alloc_bytes_per_frame']} bytes/frame, baseline {base['alloc_bytes_per_frame']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless rendering benchmarks for the water sort game")
+    parser.add_argument('--frames', type=int, default=600, help="timed frames per scenario")
+    parser.add_argument('--trace-frames', type=int, default=120, help="frames per scenario traced for allocations")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help="run only this scenario (repeatable)")
+    parser.add_argument('--baseline', help="baseline JSON to compare with or update "
+                        "(default: the local baseline if there is one, else the reference)")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="write the results to the baseline (default: the local one) instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown or allocation growth")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.baseline is None:
+        use_local = args.update_baseline or os.path.exists(LOCAL_BASELINE)
+        args.baseline = LOCAL_BASELINE if use_local else REFERENCE_BASELINE
+
+    pygame.init()
+    module = load_game_module()
+    screen = pygame.display.set_mode((module.SCREEN_WIDTH, module.SCREEN_HEIGHT))
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(module, screen, name, args.frames, args.trace_frames)
+        result = results[name]
+        print(f"{name:<18} {result['fps']:>9.1f} fps {result['ms_per_frame']:>8.3f} ms/frame {result['alloc_bytes_per_frame']:>8} B/frame")
+    pygame.quit()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        baseline['machine'] = machine_info()
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return 1
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('machine') != machine_info():
+        print(f"baseline measured on {baseline.get('machine')}; frame rates may not compare")
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
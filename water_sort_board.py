@@ -0,0 +1,243 @@
+"""Compact board model for the water sort puzzle.
+
+All bottles share one ``bytearray``: bottle ``i`` owns ``capacities[i]``
+cells from ``starts[i]`` on, bottom first, and ``heights[i]`` says how many
+of them are filled.  Bottles may differ in size (2 to 8 cells); the cells are
+packed back to back, so a board takes one byte per cell whatever the mix.
+Copying a board is a few buffer copies, which keeps search and simulation
+cheap.
+
+Alongside the cells the board tracks the length of every bottle's top run and
+how many bottles are complete, and keeps how many segments of each colour
+there are (pours never change that).  ``pour`` updates both for the two bottles it
+touches, so top runs, completion and the win check never rescan contents.
+
+The board a game is played on can also carry a ``TopColorIndex``; search
+copies never do, so they don't pay for keeping it up to date.
+"""
+from itertools import accumulate
+
+MIN_CAPACITY = 2
+MAX_CAPACITY = 8
+
+
+def bottle_capacities(num_bottles, capacity):
+    """Per-bottle capacities from one capacity for all bottles or a sequence of them"""
+    if isinstance(capacity, int):
+        capacities = bytes([capacity]) * num_bottles
+    else:
+        capacities = bytes(capacity)
+        if len(capacities) != num_bottles:
+            raise ValueError(f"{len(capacities)} capacities given for {num_bottles} bottles")
+    if capacities and not MIN_CAPACITY <= min(capacities) <= max(capacities) <= MAX_CAPACITY:
+        raise ValueError(f"bottle capacities must be {MIN_CAPACITY} to {MAX_CAPACITY}")
+    return capacities
+
+
+class Board:
+    __slots__ = ('capacity', 'capacities', 'starts', 'cells', 'heights', 'runs', 'complete', 'totals', 'top_index')
+
+    def __init__(self, num_bottles, capacity=4):
+        # ``capacity`` is an int for bottles of one size or a sequence with
+        # one capacity per bottle; ``self.capacity`` is None on a mixed board
+        capacities = bottle_capacities(num_bottles, capacity)
+        self.capacities = capacities
+        self.capacity = capacities[0] if capacities and capacities.count(capacities[0]) == num_bottles else None
+        self.starts = tuple(accumulate(capacities, initial=0))[:-1] # First cell of each bottle
+        self.cells = bytearray(sum(capacities))
+        self.heights = bytearray(num_bottles)
+        self.top_index = None # Optional TopColorIndex kept in step by pour
+        self.retrack()
+
+    def retrack(self):
+        """Recompute the tracked runs, complete count and colour totals from the cells"""
+        self.runs = bytearray(len(self.heights)) # Length of each bottle's top run of one colour
+        for i in range(len(self.heights)):
+            self.runs[i] = self.scan_top_run(i)
+        # Number of full single-colour bottles
+        self.complete = sum(1 for run, capacity in zip(self.runs, self.capacities) if run == capacity)
+        totals = [] # Segments of each colour on the board
+        for i in range(len(self.heights)):
+            for color in self.contents(i):
+                if color >= len(totals):
+                    totals.extend([0] * (color + 1 - len(totals)))
+                totals[color] += 1
+        self.totals = tuple(totals)
+
+    @classmethod
+    def from_contents(cls, contents, capacity=4):
+        """Build a board from a list of bottle contents (colour indices, bottom first)"""
+        board = cls(len(contents), capacity)
+        for i, content in enumerate(contents):
+            if len(content) > board.capacities[i]:
+                raise ValueError(f"bottle {i} holds {len(content)} segments but only has room for {board.capacities[i]}")
+            start = board.starts[i]
+            board.cells[start:start + len(content)] = bytes(content)
+            board.heights[i] = len(content)
+        board.retrack()
+        return board
+
+    def copy(self):
+        # Skips __init__: the search copies boards more than anything else.
+        # The layout never changes, so it is shared rather than copied.
+        board = Board.__new__(Board)
+        board.capacity = self.capacity
+        board.capacities = self.capacities
+        board.starts = self.starts
+        board.cells = self.cells[:]
+        board.heights = self.heights[:]
+        board.runs = self.runs[:]
+        board.complete = self.complete
+        board.totals = self.totals
+        board.top_index = None
+        return board
+
+    def __len__(self):
+        return len(self.heights)
+
+    def contents(self, index):
+        start = self.starts[index]
+        return list(self.cells[start:start + self.heights[index]])
+
+    def all_contents(self):
+        return [self.contents(i) for i in range(len(self.heights))]
+
+    def key(self):
+        """Exact, hashable snapshot of the board"""
+        return bytes(self.cells) + bytes(self.heights)
+
+    def canonical_key(self):
+        """Key shared by every bottle ordering of the same board"""
+        cells, starts, heights = self.cells, self.starts, self.heights
+        if self.capacity is not None:
+            return tuple(sorted(bytes(cells[start:start + h]) for start, h in zip(starts, heights)))
+        # Only bottles of the same size are interchangeable
+        return tuple(sorted(bytes((capacity,)) + cells[start:start + h]
+                            for capacity, start, h in zip(self.capacities, starts, heights)))
+
+    def top_color(self, index):
+        height = self.heights[index]
+        if not height: return None
+        return self.cells[self.starts[index] + height - 1]
+
+    def top_run(self, index):
+        return self.runs[index]
+
+    def scan_top_run(self, index):
+        height = self.heights[index]
+        if not height: return 0
+        start = self.starts[index]
+        cells = self.cells
+        top = start + height - 1
+        color = cells[top]
+        pos = top
+        while pos > start and cells[pos - 1] == color:
+            pos -= 1
+        return top - pos + 1
+
+    def is_full(self, index):
+        return self.heights[index] == self.capacities[index]
+
+    def is_empty(self, index):
+        return self.heights[index] == 0
+
+    def is_complete(self, index):
+        # A top run as long as the bottle can only be a full one
+        return self.runs[index] == self.capacities[index]
+
+    def is_solved(self):
+        # Every bottle is either empty or full of a single colour
+        heights = self.heights
+        return self.complete + heights.count(0) == len(heights)
+
+    def pour_amount(self, from_index, to_index):
+        """Segments a pour would move, or 0 if the pour is not allowed"""
+        if from_index == to_index: return 0
+        heights = self.heights
+        if not heights[from_index]: return 0
+        free = self.capacities[to_index] - heights[to_index]
+        if not free: return 0
+        if heights[to_index] and self.top_color(to_index) != self.top_color(from_index):
+            return 0 # Can't mix different colors
+        return min(self.runs[from_index], free)
+
+    def pour(self, from_index, to_index, segments):
+        """Move ``segments`` cells from the top of one bottle onto another.
+
+        The cells must come from the source's top run.  The target's top may
+        be any colour, so an undo can pour a run back where it came from.
+        """
+        cells, heights, runs, capacities = self.cells, self.heights, self.runs, self.capacities
+        src = self.starts[from_index] + heights[from_index] - segments
+        dst = self.starts[to_index] + heights[to_index]
+        color = cells[src]
+        joins = heights[to_index] and cells[dst - 1] == color
+        if runs[from_index] == capacities[from_index]:
+            self.complete -= 1
+
+        cells[dst:dst + segments] = cells[src:src + segments]
+        cells[src:src + segments] = bytes(segments)
+        heights[from_index] -= segments
+        heights[to_index] += segments
+
+        runs[to_index] = runs[to_index] + segments if joins else segments
+        if runs[to_index] == capacities[to_index]:
+            self.complete += 1
+        if segments < runs[from_index]:
+            runs[from_index] -= segments
+        else:
+            # The whole run left; the one below it has to be measured
+            runs[from_index] = self.scan_top_run(from_index)
+        if self.top_index is not None:
+            self.top_index.update(self, from_index, to_index)
+
+
+class TopColorIndex:
+    """Bottles grouped by what they can take, so spotting a stuck board needs no scan.
+
+    ``by_color`` maps a colour to the bottles whose top is that colour,
+    ``empty`` holds the empty bottles and ``open`` every bottle that is not
+    full.  Attach one with ``board.top_index = TopColorIndex(board)`` and
+    ``Board.pour`` keeps it current.
+    """
+
+    def __init__(self, board):
+        self.by_color = {}
+        self.empty = set()
+        self.open = set()
+        self.tops = [None] * len(board) # Colour each bottle is filed under
+        for i in range(len(board)):
+            self.add(board, i)
+
+    def add(self, board, index):
+        color = board.top_color(index)
+        self.tops[index] = color
+        if color is None:
+            self.empty.add(index)
+        else:
+            self.by_color.setdefault(color, set()).add(index)
+        if not board.is_full(index):
+            self.open.add(index)
+
+    def remove(self, index):
+        color = self.tops[index]
+        if color is None:
+            self.empty.discard(index)
+        else:
+            bottles = self.by_color[color]
+            bottles.discard(index)
+            if not bottles:
+                del self.by_color[color]
+        self.open.discard(index)
+
+    def update(self, board, *indices):
+        for index in indices:
+            self.remove(index)
+            self.add(board, index)
+
+    def has_moves(self, board):
+        """True if any pour is possible"""
+        if self.empty:
+            return len(self.empty) < len(self.tops) # Anything non-empty can pour into it
+        # Without an empty bottle a pour needs two bottles of one top colour, one not full
+        return any(len(bottles) > 1 and bottles & self.open for bottles in self.by_color.values())
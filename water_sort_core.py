@@ -0,0 +1,318 @@
+"""Rules and state of the water sort puzzle, with no rendering.
+
+Importing this module never touches pygame or SDL, so it can drive batch
+simulations, tests and servers.  ``WaterSortGame`` in the game script builds
+its drawing and input handling on top of ``GameCore``.
+"""
+import random
+
+from water_sort_board import TopColorIndex
+from water_sort_generator import (DEFAULT_CUSTOM_BOTTLES, LEVEL_PRESETS, PRESET_CAPACITY, capacity_range, custom_preset,
+                                  generate_board)
+from water_sort_solver import solve
+
+LEVELS = list(LEVEL_PRESETS) + ['custom'] # 'custom' is the large-board mode
+
+SCORE_MULTIPLIERS = {'easy': 1, 'medium': 1.5, 'hard': 2, 'custom': 3}
+
+# Hint search on custom and mixed-size boards: too big or too irregular to
+# solve outright, so the search gets a time budget and falls back to the
+# most promising partial line
+BOUNDED_HINT_OPTIONS = {'weight': 3, 'time_limit': 0.06, 'partial': True}
+
+
+def points_for_pour(segments_poured, level):
+    """Points earned by pouring ``segments_poured`` segments on a level"""
+    base_points = 10
+    multiplier = SCORE_MULTIPLIERS.get(level, 1)
+    bonus = segments_poured * 5 if segments_poured > 1 else 0
+    return round((base_points * segments_poured * multiplier) + bonus)
+
+
+class GameCore:
+    def __init__(self, level='easy', seed=None, recorder=None, store=None, custom_bottles=DEFAULT_CUSTOM_BOTTLES, capacity=4):
+        self.selected_bottle = None # Index of the selected bottle
+        self.hint_move = None # (from_index, to_index) of the current hint
+        self.moves = 0
+        self.game_started = False
+        self.won = False # Set by the game's first win, which alone earns progress
+        self.current_level = level
+        self.custom_bottles = custom_bottles # Bottles on a 'custom' level board
+        self.capacity = capacity # Bottle size, or a (low, high) range for mixed sizes
+        self.solution_moves = {} # Board.key() -> next move of the generator's solution
+        self.seed = None
+        self.board = None
+        self.score = 0
+        # Both keyed by progress_key(), so each board setting keeps its own
+        self.high_scores = {level: 0 for level in LEVELS}
+        self.level_progresses = {level: 0 for level in LEVELS}
+        # Optional water_sort_store.ScoreStore that keeps the two above across runs
+        self.store = store
+        if store is not None:
+            self.load_progress()
+        # Poured moves as flat (from, to, segments) byte triples; a pour is
+        # fully described by them, so undo and redo never copy the board
+        self.history = bytearray()
+        self.redo_history = bytearray()
+        # Optional water_sort_replay.ReplayRecorder that logs the session
+        self.recorder = recorder
+        # Optional water_sort_hints.HintWorker; with one, show_hint only starts
+        # the search and poll_hint picks up its result
+        self.hint_worker = None
+
+        self.initialize_game(seed)
+
+    def initialize_game(self, seed=None):
+        if self.recorder is not None and self.board is not None:
+            self.record_end() # The game being replaced
+        self.cancel_hint()
+
+        # Deal a board the solver has verified, reproducible from its seed
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.board, solution = generate_board(self.current_level, self.seed, self.capacity, num_bottles=self.custom_bottles)
+        self.board.top_index = TopColorIndex(self.board)
+        self.solution_moves = self.index_solution(solution)
+        if self.recorder is not None:
+            self.recorder.game(self.current_level, self.seed, self.custom_bottles, capacity_range(self.capacity))
+
+        self.selected_bottle = None
+        self.hint_move = None
+        self.moves = 0
+        self.game_started = False
+        self.won = False
+        self.score = 0
+        self.history = bytearray()
+        self.redo_history = bytearray()
+
+    def start_game(self):
+        self.game_started = True
+
+    def new_game(self):
+        self.initialize_game()
+
+    def set_level(self, level, custom_bottles=None, capacity=None):
+        if custom_bottles is not None:
+            custom_preset(custom_bottles) # Rejects sizes out of range
+            self.custom_bottles = custom_bottles
+        if capacity is not None:
+            capacity_range(capacity) # Rejects sizes out of range
+            self.capacity = capacity
+        self.current_level = level
+        self.new_game()
+
+    def select_bottle(self, index):
+        """Apply a click on bottle ``index`` (None for a click outside every bottle)"""
+        if not self.game_started:
+            print("Please start the game first!") # In Pygame, this would be a UI message
+            return
+        if self.check_win_condition():
+            return # A finished board takes no more pours
+
+        # Remove any hint highlights
+        self.hint_move = None
+
+        if index is None: # Clicked outside bottles
+            self.selected_bottle = None
+            return
+
+        if self.selected_bottle is None:
+            # Select this bottle if it's not empty
+            if not self.board.is_empty(index):
+                self.selected_bottle = index
+        else:
+            # Try to pour from selected bottle to this one
+            if self.selected_bottle != index:
+                if self.pour_liquid(self.selected_bottle, index):
+                    self.moves += 1
+                    if self.recorder is not None:
+                        self.recorder.pour(self.selected_bottle, index)
+                    # Check for win condition
+                    if self.check_win_condition():
+                        self.handle_level_complete()
+
+            # Deselect the bottle
+            self.selected_bottle = None
+
+    def pour_liquid(self, from_index, to_index):
+        segments_to_pour = self.board.pour_amount(from_index, to_index)
+        if segments_to_pour == 0: return False
+
+        self.complete_pour(from_index, to_index, segments_to_pour)
+        return True
+
+    def complete_pour(self, from_index, to_index, segments_to_pour):
+        # Ensure there's actually liquid to pour before moving it
+        if self.board.is_empty(from_index):
+            return # Should not happen if pour_liquid checks are correct, but as a safeguard
+
+        self.cancel_hint() # Its board is gone
+        self.board.pour(from_index, to_index, segments_to_pour)
+        self.update_score(segments_to_pour)
+        self.history += bytes((from_index, to_index, segments_to_pour))
+        if self.redo_history:
+            self.redo_history = bytearray() # A new pour forks the history
+
+    def undo(self):
+        """Take back the last pour; returns its (from, to, segments) or None"""
+        if not self.history: return None
+        move = from_index, to_index, segments = tuple(self.history[-3:])
+        del self.history[-3:]
+        if self.recorder is not None:
+            self.recorder.undo()
+
+        # The poured run sits on top of the target, so pouring it straight
+        # back restores both bottles
+        self.cancel_hint()
+        self.board.pour(to_index, from_index, segments)
+        self.score -= points_for_pour(segments, self.current_level)
+        self.moves -= 1
+        self.redo_history += bytes(move)
+        self.selected_bottle = None
+        self.hint_move = None
+        return move
+
+    def redo(self):
+        """Pour the last undone move again; returns its (from, to, segments) or None"""
+        if not self.redo_history: return None
+        move = tuple(self.redo_history[-3:])
+        del self.redo_history[-3:]
+        if self.recorder is not None:
+            self.recorder.redo()
+
+        redo_history = self.redo_history # complete_pour drops it for new pours
+        self.complete_pour(*move)
+        self.redo_history = redo_history
+        self.moves += 1
+        self.selected_bottle = None
+        self.hint_move = None
+        # Redoing a winning pour that was already rewarded changes nothing
+        if not self.won and self.check_win_condition():
+            self.handle_level_complete()
+        return move
+
+    def index_solution(self, solution):
+        """Map every board along ``solution`` to the move it takes next"""
+        board = self.board.copy()
+        moves = {}
+        for from_index, to_index in solution:
+            moves[board.key()] = (from_index, to_index) # Later visits skip any loop
+            board.pour(from_index, to_index, board.pour_amount(from_index, to_index))
+        return moves
+
+    def top_index(self):
+        # Boards assigned from outside (benchmarks, tests) get theirs on first use
+        if self.board.top_index is None:
+            self.board.top_index = TopColorIndex(self.board)
+        return self.board.top_index
+
+    def has_legal_move(self):
+        return self.top_index().has_moves(self.board)
+
+    def check_win_condition(self):
+        # Game is won when each bottle is either full of one color or empty
+        return self.board.is_solved()
+
+    def record_end(self):
+        self.recorder.end(self.score, self.moves, self.check_win_condition())
+
+    def handle_level_complete(self):
+        if self.recorder is not None:
+            self.record_end()
+        if self.won: return # Already rewarded
+        self.won = True
+        key = self.progress_key()
+        if self.score > self.high_score():
+            self.high_scores[key] = self.score
+
+        self.level_progresses[key] = min(100, self.level_progress() + 20)
+        self.save_progress()
+
+    def progress_key(self):
+        """Name the current board setting's high score and progress are kept under
+
+        Boards with other bottle sizes or counts score differently, so they get
+        their own entries; the default setting of a level is just its name.
+        """
+        key = self.current_level
+        if self.current_level == 'custom' and self.custom_bottles != DEFAULT_CUSTOM_BOTTLES:
+            key += f" {self.custom_bottles} bottles"
+        low, high = capacity_range(self.capacity)
+        if (low, high) != (PRESET_CAPACITY, PRESET_CAPACITY):
+            key += f" capacity {low}" if low == high else f" capacity {low}-{high}"
+        return key
+
+    def high_score(self):
+        return self.high_scores.get(self.progress_key(), 0)
+
+    def level_progress(self):
+        return self.level_progresses.get(self.progress_key(), 0)
+
+    def load_progress(self):
+        data = self.store.load()
+        for name, values in (('high_scores', self.high_scores), ('level_progresses', self.level_progresses)):
+            stored = data.get(name)
+            if not isinstance(stored, dict): continue
+            for key, value in stored.items():
+                if isinstance(value, int):
+                    values[key] = value
+
+    def save_progress(self):
+        # Written behind by the store's thread; this only queues a snapshot
+        if self.store is not None:
+            self.store.save({'high_scores': self.high_scores, 'level_progresses': self.level_progresses})
+
+    def update_score(self, segments_poured):
+        points_earned = points_for_pour(segments_poured, self.current_level)
+        self.score += points_earned
+        return points_earned
+
+    def show_hint(self):
+        """Set ``hint_move`` to the first pour of a solution and return it.
+
+        With a ``hint_worker`` the search runs in the background: this returns
+        None at once and ``poll_hint`` sets ``hint_move`` when it finishes.
+        """
+        if not self.game_started:
+            print("Please start the game first!")
+            return None
+
+        # Highlight the first pour of a solution found by the solver
+        self.hint_move = None
+        if not self.has_legal_move():
+            # Stuck or finished; no search needed
+            return self.finish_hint([] if self.check_win_condition() else None)
+        # Still on the generator's solution: no search needed
+        move = self.solution_moves.get(self.board.key())
+        if move is not None:
+            return self.finish_hint([move])
+
+        bounded = self.current_level == 'custom' or self.board.capacity is None
+        options = BOUNDED_HINT_OPTIONS if bounded else {}
+        if self.hint_worker is not None:
+            self.hint_worker.submit(self.board, **options)
+            return None
+        return self.finish_hint(solve(self.board, **options))
+
+    def poll_hint(self):
+        """Apply a finished background search; returns True if one was applied"""
+        if self.hint_worker is None: return False
+        done, solution = self.hint_worker.poll()
+        if done:
+            self.finish_hint(solution)
+        return done
+
+    def cancel_hint(self):
+        if self.hint_worker is not None:
+            self.hint_worker.cancel()
+
+    def finish_hint(self, solution):
+        if solution is None:
+            print("No solution from this position!") # In Pygame, this would be a UI message
+        elif not solution:
+            print("Puzzle already solved!") # In Pygame, this would be a UI message
+        else:
+            self.hint_move = solution[0]
+
+        if self.recorder is not None:
+            self.recorder.hint(self.hint_move)
+        return self.hint_move
@@ -0,0 +1,192 @@
+"""Level generator that only hands out solvable boards.
+
+Candidates are dealt the same way the game always dealt them - shuffled colour
+segments in full bottles plus some empty ones - and each one is checked with
+the solver.  Boards without a solution, or with one shorter than the level's
+minimum, are dealt again.
+
+The custom large-board mode (30 to 100 bottles) is far beyond what the solver
+can verify, so those boards are built the other way round: start from a
+sorted board and apply random pours in reverse.  Every reverse step is the
+exact undo of a legal pour, so the recorded steps played backwards always
+solve the board.
+
+``generate_board`` takes a ``capacity`` setting: one bottle size for the
+whole board, or a ``(low, high)`` range from which each bottle's size is
+drawn.  On a mixed board every colour has as many segments as the bottle it
+started in holds.  Random mixed deals are rarely solvable and slow to rule
+out, so mixed boards are always scrambled; the solver then only looks for a
+shorter solution within a small budget, and a candidate it can't shorten is
+taken as it is.  Level minimums are scaled to the segments per colour, so
+small bottles don't deal candidate after candidate looking for a solution
+length they can't reach.
+"""
+import math
+import random
+
+from water_sort_board import MAX_CAPACITY, MIN_CAPACITY, Board
+from water_sort_solver import TranspositionTable, solve
+
+# level: (bottles, colors)
+LEVEL_PRESETS = {
+    'easy': (5, 3),    # 3 color bottles + 2 empty
+    'medium': (7, 4),  # 4 color bottles + 3 empty
+    'hard': (9, 5),    # 5 color bottles + 4 empty
+}
+
+# Fewest moves the solver may need before a board counts as a real puzzle,
+# for bottles of PRESET_CAPACITY; see min_solution_moves
+MIN_SOLUTION_MOVES = {'easy': 6, 'medium': 9, 'hard': 12}
+PRESET_CAPACITY = 4
+
+# Expansion budget for checking one candidate; solvable presets need far less
+CHECK_MAX_NODES = 5000
+# Budget and search weight for shortening the solution of a scrambled
+# mixed-size candidate, and how many candidates a mixed board may take
+MIXED_CHECK_MAX_NODES = 30
+MIXED_CHECK_WEIGHT = 3
+MIXED_MAX_ATTEMPTS = 2
+
+# Custom large-board mode
+CUSTOM_BOTTLES_RANGE = (30, 100)
+DEFAULT_CUSTOM_BOTTLES = 40
+SCRAMBLE_STEPS_PER_CELL = 2 # Reverse pours per liquid cell when scrambling
+
+
+def custom_preset(num_bottles):
+    """(bottles, colors) for a custom board: about one empty bottle in ten"""
+    low, high = CUSTOM_BOTTLES_RANGE
+    if not low <= num_bottles <= high:
+        raise ValueError(f"custom boards have {low} to {high} bottles, not {num_bottles}")
+    return num_bottles, num_bottles - max(2, num_bottles // 10)
+
+
+def capacity_range(capacity):
+    """(low, high) bottle sizes of a capacity setting, checked against the allowed sizes"""
+    low, high = (capacity, capacity) if isinstance(capacity, int) else capacity
+    if not MIN_CAPACITY <= low <= high <= MAX_CAPACITY:
+        raise ValueError(f"bottle capacities must be {MIN_CAPACITY} to {MAX_CAPACITY}, not {capacity}")
+    return low, high
+
+
+def min_solution_moves(difficulty, capacity):
+    """Level minimum for a board capacity (one size or per-bottle sizes)"""
+    sizes = [capacity] if isinstance(capacity, int) else capacity
+    average = sum(sizes) / len(sizes)
+    return math.ceil(MIN_SOLUTION_MOVES[difficulty] * average / PRESET_CAPACITY)
+
+
+def bottle_sizes(num_bottles, capacity, rng):
+    """Board capacity for a capacity setting: one size, or a size per bottle drawn from the range"""
+    low, high = capacity_range(capacity)
+    if low == high:
+        return low
+    return [rng.randint(low, high) for _ in range(num_bottles)]
+
+
+def deal(num_bottles, num_colors, rng, capacity=4):
+    """Return shuffled bottle contents: full bottles of mixed colours, then empties"""
+    color_segments = [color for color in range(num_colors) for _ in range(capacity)]
+    rng.shuffle(color_segments)
+    contents = [color_segments[i * capacity:(i + 1) * capacity] for i in range(num_colors)]
+    contents.extend([] for _ in range(num_bottles - num_colors))
+    rng.shuffle(contents) # Shuffle bottles to randomize empty bottle positions
+    return contents
+
+
+def reverse_pour(board, rng):
+    """Undo a random pour that could have led to ``board``.
+
+    Returns the pour as (from, to), or None if the board has no possible
+    predecessor.
+    """
+    capacities, heights, runs = board.capacities, board.heights, board.runs
+    tops = [board.top_color(i) for i in range(len(heights))]
+    open_bottles = [i for i in range(len(heights)) if heights[i] < capacities[i]]
+
+    # Taking back a target's whole top run is only an undo if nothing was
+    # under it; otherwise the pour would have met a different top colour
+    targets = [i for i, height in enumerate(heights) if height and (runs[i] == height or runs[i] > 1)]
+    rng.shuffle(targets)
+    for target in targets:
+        height, color = heights[target], tops[target]
+        # A source still showing the same colour would have poured that too,
+        # unless the target filled up
+        sources = [i for i in open_bottles if i != target and (tops[i] != color or height == capacities[target])]
+        if not sources: continue
+        source = rng.choice(sources)
+        most = runs[target] if runs[target] == height else runs[target] - 1
+        board.pour(target, source, rng.randint(1, min(most, capacities[source] - heights[source])))
+        return source, target
+    return None
+
+
+def scramble(num_bottles, num_colors, rng, capacity=4):
+    """Return a scrambled board and the moves that sort it again.
+
+    Reverse pours run until the board has no possible predecessor - every
+    bottle mixed and topped by a single segment, like a fresh deal - or
+    until the step budget runs out.  ``capacity`` is one size for every
+    bottle or a list of per-bottle sizes.
+    """
+    if isinstance(capacity, int):
+        contents = [[color] * capacity for color in range(num_colors)]
+        contents.extend([] for _ in range(num_bottles - num_colors))
+        rng.shuffle(contents)
+    else:
+        contents = [[] for _ in range(num_bottles)]
+        for color, i in enumerate(sorted(rng.sample(range(num_bottles), num_colors))):
+            contents[i] = [color] * capacity[i]
+    board = Board.from_contents(contents, capacity)
+
+    undone = []
+    for _ in range(SCRAMBLE_STEPS_PER_CELL * sum(board.heights)):
+        move = reverse_pour(board, rng)
+        if move is None: break
+        undone.append(move)
+    undone.reverse()
+    return board, undone
+
+
+def generate_board(difficulty='easy', seed=None, capacity=4, max_attempts=100, num_bottles=None):
+    """Generate a solvable board for a level preset.
+
+    The same ``seed`` always yields the same board.  Returns
+    ``(board, solution)`` where ``solution`` is the move list the solver found.
+    ``difficulty='custom'`` makes a scrambled board of ``num_bottles``
+    bottles, whose solution is the scramble played backwards.  ``capacity``
+    is one bottle size or a ``(low, high)`` range for a mixed board.
+    """
+    if difficulty == 'custom':
+        rng = random.Random(seed)
+        num_bottles, num_colors = custom_preset(num_bottles or DEFAULT_CUSTOM_BOTTLES)
+        return scramble(num_bottles, num_colors, rng, bottle_sizes(num_bottles, capacity, rng))
+
+    num_bottles, num_colors = LEVEL_PRESETS[difficulty]
+    rng = random.Random(seed)
+    capacity = bottle_sizes(num_bottles, capacity, rng)
+    min_moves = min_solution_moves(difficulty, capacity)
+    table = TranspositionTable(CHECK_MAX_NODES * num_bottles)
+    if not isinstance(capacity, int):
+        max_attempts = min(max_attempts, MIXED_MAX_ATTEMPTS)
+
+    best = None
+    for _ in range(max_attempts):
+        if isinstance(capacity, int):
+            board = Board.from_contents(deal(num_bottles, num_colors, rng, capacity), capacity)
+            solution = solve(board, max_nodes=CHECK_MAX_NODES, table=table)
+            if not solution: continue
+        else:
+            board, scrambled = scramble(num_bottles, num_colors, rng, capacity)
+            solution = solve(board, max_nodes=MIXED_CHECK_MAX_NODES, weight=MIXED_CHECK_WEIGHT, table=table)
+            if solution is None:
+                # Nothing shorter within the budget; play the scramble back
+                return board, scrambled
+        if len(solution) >= min_moves:
+            return board, solution
+        if best is None or len(solution) > len(best[1]):
+            best = (board, solution)
+
+    if best is None:
+        raise RuntimeError(f"no solvable {difficulty} board found in {max_attempts} attempts")
+    return best
@@ -0,0 +1,61 @@
+"""Background hint search for the water sort game.
+
+``HintWorker`` runs the solver on a worker thread so asking for a hint never
+blocks the caller.  Only the newest search matters: submitting a new board or
+calling ``cancel`` sets the running search's cancel flag, and its result is
+dropped when it finishes.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from water_sort_solver import solve
+
+
+class HintWorker:
+    def __init__(self, notify=None):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hint-solver')
+        self.notify = notify # Called on the worker thread when a search finishes
+        self.future = None
+        self.cancel_event = None
+
+    @property
+    def ready(self):
+        """True once the current search has finished and ``poll`` will return it"""
+        return self.future is not None and self.future.done()
+
+    def submit(self, board, **options):
+        """Start solving a copy of ``board``, cancelling any earlier search.
+
+        ``options`` are passed on to ``solve``.
+        """
+        self.cancel()
+        self.cancel_event = threading.Event()
+        future = self.future = self.executor.submit(solve, board.copy(), cancel=self.cancel_event, **options)
+        if self.notify is not None:
+            future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        # Read at call time: close() clears it so a search finishing after
+        # shutdown doesn't call into whatever the caller has torn down
+        notify = self.notify
+        if notify is not None:
+            notify()
+
+    def cancel(self):
+        if self.future is not None:
+            self.cancel_event.set()
+            self.future.cancel()
+            self.future = None
+
+    def poll(self):
+        """Return ``(True, solution)`` once the current search is done, else ``(False, None)``"""
+        future = self.future
+        if future is None or not future.done():
+            return False, None
+        self.future = None
+        return True, future.result()
+
+    def close(self):
+        self.notify = None
+        self.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,91 @@
+"""Frame timing for the water sort game loop.
+
+``FrameProfiler`` times named stages of each frame with ``perf_counter``,
+keeps a rolling window per stage for p50/p95/p99 readouts, and can keep every
+frame's timings for a CSV or JSON dump.  It does not depend on pygame.
+"""
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values: return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class FrameProfiler:
+    def __init__(self, window=240, record=False):
+        self.enabled = record
+        self.record = record
+        self.window = window
+        self.history = {} # stage -> deque of per-frame milliseconds
+        self.records = []
+        self.current = {}
+        self.frame_index = 0
+        self.frame_start = 0.0
+        self.start_time = time.perf_counter()
+
+    def stage(self, name):
+        """Context manager that adds the time spent inside it to ``name``"""
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] = self.current.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def begin_frame(self):
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled: return
+        now = time.perf_counter()
+        self.current['total'] = (now - self.frame_start) * 1000
+        for name, ms in self.current.items():
+            history = self.history.get(name)
+            if history is None:
+                history = self.history[name] = deque(maxlen=self.window)
+            history.append(ms)
+        if self.record:
+            record = {'frame': self.frame_index, 'time_ms': round((self.frame_start - self.start_time) * 1000, 3)}
+            record.update((name, round(ms, 4)) for name, ms in self.current.items())
+            self.records.append(record)
+        self.frame_index += 1
+
+    def summary(self):
+        """Return {stage: (p50, p95, p99)} in milliseconds over the rolling window"""
+        result = {}
+        for name, history in self.history.items():
+            values = sorted(history)
+            result[name] = (percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99))
+        return result
+
+    def dump(self, path):
+        """Write the recorded frames to ``path``; a .json suffix selects JSON, anything else CSV"""
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'frames': self.records, 'summary': self.summary()}, f, indent=1)
+            return
+
+        stages = []
+        for record in self.records:
+            for name in record:
+                if name not in stages:
+                    stages.append(name)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=stages, restval=0)
+            writer.writeheader()
+            writer.writerows(self.records)
@@ -0,0 +1,185 @@
+"""Render caches for the pygame front end of the water sort game."""
+from collections import OrderedDict
+
+import pygame
+
+
+class StaticLayer:
+    """Pre-rendered surface for content that only changes with layout or theme.
+
+    ``build(surface)`` draws the content onto a fresh opaque surface.  It runs
+    again only when the key passed to ``get`` changes or after ``invalidate``.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.key = None
+        self.surface = None
+
+    def invalidate(self):
+        self.surface = None
+
+    def get(self, size, key=None):
+        if self.surface is None or self.key != key or self.surface.get_size() != size:
+            surface = pygame.Surface(size)
+            self.build(surface)
+            # Match the display format so blitting the layer is a plain copy
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            self.surface = surface
+            self.key = key
+        return self.surface
+
+
+class DirtyRegions:
+    """Screen areas that changed since the last display update.
+
+    State changes ``mark`` the rectangles they affect; the main loop ``pop``s
+    the merged list, redraws only those areas and passes the same list to
+    ``pygame.display.update``.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = pygame.Rect(bounds)
+        self.rects = []
+        self.full = False
+
+    def __bool__(self):
+        return self.full or bool(self.rects)
+
+    def mark(self, rect):
+        rect = self.bounds.clip(rect)
+        if rect.width and rect.height:
+            self.rects.append(rect)
+
+    def mark_all(self):
+        self.full = True
+
+    def pop(self):
+        """Return the merged dirty rectangles and start tracking afresh"""
+        if self.full:
+            rects = [self.bounds.copy()]
+        else:
+            # Merge overlapping rectangles until none overlap
+            rects = []
+            for rect in self.rects:
+                index = rect.collidelist(rects)
+                while index != -1:
+                    rect = rect.union(rects.pop(index))
+                    index = rect.collidelist(rects)
+                rects.append(rect)
+        self.rects = []
+        self.full = False
+        return rects
+
+
+class SurfaceCache:
+    """Bounded cache of pre-rendered surfaces, evicting the least recently used.
+
+    ``render(key)`` draws the surface for a key on a miss.  Surfaces are
+    converted to the display format once, so every later blit is cheap.
+    """
+
+    def __init__(self, render, max_entries=128):
+        self.render = render
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def get(self, key):
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.render(key)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+class TextCache(SurfaceCache):
+    """Rendered text surfaces keyed by (font, text, color, alpha).
+
+    Entries are shared between callers, so they must not be changed; ask for
+    a faded copy with ``alpha`` instead of calling ``set_alpha`` on one.
+    """
+
+    def __init__(self, max_entries=256):
+        super().__init__(self.render_text, max_entries)
+
+    @staticmethod
+    def render_text(key):
+        font, text, color, alpha = key
+        surface = font.render(text, True, color)
+        if alpha < 255:
+            surface.set_alpha(alpha)
+        return surface
+
+    def text(self, font, text, color, alpha=255):
+        return self.get((font, text, color, alpha))
+
+
+class ParticleAtlas(SurfaceCache):
+    """Round particle sprites keyed by (color, radius, alpha).
+
+    ``trail`` fetches a whole trail at once - one sprite per particle,
+    shrinking and fading from head to tail - so drawing a trail takes nothing
+    but blits.
+    """
+
+    def __init__(self, max_entries=2048):
+        super().__init__(self.render_particle, max_entries)
+
+    @staticmethod
+    def render_particle(key):
+        color, radius, alpha = key
+        surface = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(surface, (*color, alpha), (radius, radius), radius)
+        return surface
+
+    def trail(self, color, radius, count):
+        """``count`` (sprite, radius) pairs, head first"""
+        particles = []
+        for i in range(count):
+            fade = i / count
+            particle_radius = max(1, round(radius * (1 - fade / 2)))
+            particles.append((self.get((color, particle_radius, round(255 * (1 - fade)))), particle_radius))
+        return particles
+
+
+class GlyphAtlas:
+    """Pre-rendered glyphs of one font and colour.
+
+    Counters that change every few frames (score, moves) are drawn glyph by
+    glyph from here, so new values never need a ``font.render`` call.
+    """
+
+    def __init__(self, font, color, chars='0123456789'):
+        self.glyphs = {}
+        for char in chars:
+            glyph = font.render(char, True, color)
+            if pygame.display.get_surface() is not None:
+                glyph = glyph.convert_alpha()
+            self.glyphs[char] = glyph
+        self.height = font.get_height()
+
+    def size(self, text):
+        return sum(self.glyphs[char].get_width() for char in text), self.height
+
+    def draw(self, surface, text, pos):
+        x, y = pos
+        blits = []
+        for char in text:
+            glyph = self.glyphs[char]
+            blits.append((glyph, (x, y)))
+            x += glyph.get_width()
+        surface.blits(blits, False)
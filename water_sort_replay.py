@@ -0,0 +1,210 @@
+"""Binary replay logs of water sort sessions and a headless replay runner.
+
+A log is a short file header followed by records.  Every record starts with a
+kind byte and the milliseconds since recording began, then a payload that
+depends on the kind:
+
+    GAME  level, seed, bottles,   a freshly dealt board (bottles: custom size;
+          capacity low, high      one bottle size, or the range of a mixed board)
+    POUR  from, to                a pour the player made
+    HINT  from, to                the hint shown (255, 255 when there was none)
+    UNDO, REDO                    no payload
+    END   score, moves, won       checkpoint at a win or when a game is left
+
+Boards are never stored: ``generate_board`` deals the same board for the same
+level and seed.  ``replay`` re-executes a log through ``GameCore`` and checks
+every END checkpoint against the score, moves and win state it reaches, so
+scoring and win detection can be regression tested across many recorded games.
+
+    python water_sort_replay.py session.wsr [more.wsr ...]
+"""
+import argparse
+import struct
+import sys
+import time
+
+from water_sort_core import LEVELS, GameCore
+from water_sort_generator import DEFAULT_CUSTOM_BOTTLES
+
+MAGIC = b'WSRP'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB')
+RECORD_HEADER = struct.Struct('<BI') # kind, milliseconds since recording began
+
+GAME, POUR, HINT, UNDO, REDO, END = range(1, 7)
+
+PAYLOADS = {
+    GAME: struct.Struct('<BIBBB'), # level index, seed, custom bottles, capacity low, high
+    POUR: struct.Struct('<BB'),   # from, to
+    HINT: struct.Struct('<BB'),   # from, to
+    UNDO: struct.Struct('<'),
+    REDO: struct.Struct('<'),
+    END: struct.Struct('<iHB'),   # score, moves, won
+}
+
+NO_HINT = 255
+
+
+class ReplayError(ValueError):
+    pass
+
+
+class ReplayRecorder:
+    """Writes a session to a binary stream as ``GameCore`` reports it.
+
+    Assign one to ``GameCore.recorder``; the core calls ``game``, ``pour``,
+    ``hint``, ``undo``, ``redo`` and ``end`` as the session goes on.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.start_time = time.monotonic()
+        self.pending = False # Records written since the last END checkpoint
+        stream.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, kind, *payload):
+        elapsed_ms = int((time.monotonic() - self.start_time) * 1000)
+        self.stream.write(RECORD_HEADER.pack(kind, elapsed_ms) + PAYLOADS[kind].pack(*payload))
+        self.pending = kind != END
+
+    def game(self, level, seed, custom_bottles, capacity_range):
+        self.write(GAME, LEVELS.index(level), seed, custom_bottles, *capacity_range)
+
+    def pour(self, from_index, to_index):
+        self.write(POUR, from_index, to_index)
+
+    def hint(self, move):
+        self.write(HINT, *(move or (NO_HINT, NO_HINT)))
+
+    def undo(self):
+        self.write(UNDO)
+
+    def redo(self):
+        self.write(REDO)
+
+    def end(self, score, moves, won):
+        """Checkpoint the game's outcome; nothing is written if nothing happened since the last one"""
+        if self.pending:
+            self.write(END, score, moves, won)
+
+    def close(self):
+        self.stream.close()
+
+
+def read_records(stream):
+    """Yield (kind, time_ms, payload) for every record of a log"""
+    header = stream.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size:
+        raise ReplayError("not a replay log: file too short")
+    magic, version = FILE_HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ReplayError("not a replay log: bad magic")
+    if version != VERSION:
+        raise ReplayError(f"unsupported replay log version {version}")
+
+    while True:
+        header = stream.read(RECORD_HEADER.size)
+        if not header: return
+        if len(header) < RECORD_HEADER.size:
+            raise ReplayError("truncated record header")
+        kind, time_ms = RECORD_HEADER.unpack(header)
+        payload_format = PAYLOADS.get(kind)
+        if payload_format is None:
+            raise ReplayError(f"unknown record kind {kind}")
+        data = stream.read(payload_format.size)
+        if len(data) < payload_format.size:
+            raise ReplayError("truncated record payload")
+        yield kind, time_ms, payload_format.unpack(data)
+
+
+def load_records(path):
+    with open(path, 'rb') as f:
+        return list(read_records(f))
+
+
+def apply_record(core, kind, payload, verify_hints=False):
+    """Apply one record to ``core`` the way the player's input did"""
+    if kind == GAME:
+        level_index, seed, custom_bottles, low, high = payload
+        core.current_level = LEVELS[level_index]
+        if custom_bottles:
+            core.custom_bottles = custom_bottles
+        core.capacity = low if low == high else (low, high)
+        core.initialize_game(seed)
+        core.start_game()
+    elif kind == POUR:
+        from_index, to_index = payload
+        core.select_bottle(from_index)
+        core.select_bottle(to_index)
+    elif kind == HINT:
+        # A hint never changes the board; re-running the solver is optional
+        if verify_hints:
+            move = core.show_hint()
+            if tuple(move or (NO_HINT, NO_HINT)) != payload:
+                return f"hint {move} != recorded {payload}"
+    elif kind == UNDO:
+        core.undo()
+    elif kind == REDO:
+        core.redo()
+    elif kind == END:
+        outcome = (core.score, core.moves, int(core.check_win_condition()))
+        if outcome != payload:
+            return f"score, moves, won {outcome} != recorded {payload}"
+    return None
+
+
+def replay(records, verify_hints=False):
+    """Re-run a record list through a headless GameCore.
+
+    Returns ``(checkpoints, mismatches)``: the number of END records reached
+    and a list of (record index, message) for every disagreement.
+    """
+    core = None
+    checkpoints = 0
+    mismatches = []
+    for index, (kind, time_ms, payload) in enumerate(records):
+        if core is None:
+            if kind != GAME:
+                raise ReplayError("replay log does not start with a GAME record")
+            level_index, seed, custom_bottles, low, high = payload
+            # Dealing the first game here is what its GAME record would do
+            core = GameCore(LEVELS[level_index], seed, custom_bottles=custom_bottles or DEFAULT_CUSTOM_BOTTLES,
+                            capacity=low if low == high else (low, high))
+            core.start_game()
+            continue
+        message = apply_record(core, kind, payload, verify_hints)
+        if message:
+            mismatches.append((index, message))
+        checkpoints += kind == END
+    return checkpoints, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay water sort session logs without rendering")
+    parser.add_argument('logs', nargs='+', help="replay log files")
+    parser.add_argument('--verify-hints', action='store_true', help="re-run the solver for recorded hints")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games = checkpoints = failures = 0
+    for path in args.logs:
+        try:
+            records = load_records(path)
+        except (OSError, ReplayError) as e:
+            print(f"{path}: {e}")
+            failures += 1
+            continue
+        games += sum(kind == GAME for kind, _, _ in records)
+        log_checkpoints, mismatches = replay(records, args.verify_hints)
+        checkpoints += log_checkpoints
+        for index, message in mismatches:
+            print(f"{path}: record {index}: {message}")
+        failures += len(mismatches)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(args.logs)} logs, {games} games, {checkpoints} checkpoints, {failures} mismatches in {elapsed:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
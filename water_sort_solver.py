@@ -0,0 +1,243 @@
+"""Solver for the water sort puzzle.
+
+The search runs on packed ``water_sort_board.Board`` states, so expanding a
+node is a buffer copy plus one pour.  Moves follow the rules of
+``WaterSortGame.pour_liquid``: the whole top run is poured, limited by the free
+space in the target, and only onto an empty bottle or a matching top colour.
+"""
+import heapq
+import time
+from collections import OrderedDict
+
+from water_sort_board import Board
+
+
+def legal_moves(board):
+    """Yield (from_index, to_index, segments, top_run) for every useful pour"""
+    if board.capacity is None:
+        return _mixed_legal_moves(board)
+    return _uniform_legal_moves(board)
+
+
+def _uniform_legal_moves(board):
+    capacity, heights, runs = board.capacity, board.heights, board.runs
+    tops = [board.top_color(i) for i in range(len(heights))]
+
+    # Group the bottles that can still take liquid by top colour, so each
+    # source only looks at its possible targets instead of every bottle.
+    # All empty bottles are equivalent, so only the first one is a target.
+    open_by_color = {}
+    first_empty = None
+    for i, color in enumerate(tops):
+        if color is None:
+            if first_empty is None: first_empty = i
+        elif heights[i] < capacity:
+            open_by_color.setdefault(color, []).append(i)
+
+    for from_idx, color in enumerate(tops):
+        if color is None: continue
+        run = runs[from_idx]
+        # Moving a finished bottle never helps
+        if run == capacity: continue
+        # Moving a single-colour bottle into an empty one only swaps places
+        try_empty = first_empty is not None and run != heights[from_idx]
+        for to_idx in open_by_color.get(color, ()):
+            if try_empty and first_empty < to_idx:
+                yield from_idx, first_empty, run, run
+                try_empty = False
+            if to_idx != from_idx:
+                yield from_idx, to_idx, min(run, capacity - heights[to_idx]), run
+        if try_empty:
+            yield from_idx, first_empty, run, run
+
+
+def _mixed_legal_moves(board):
+    # Same moves in the same order as _uniform_legal_moves, but empty bottles
+    # are only equivalent to others of their size, a top run may not fit
+    # into a smaller empty bottle, and a full bottle is only finished if it
+    # holds every segment of its colour
+    capacities, heights, runs, totals = board.capacities, board.heights, board.runs, board.totals
+    tops = [board.top_color(i) for i in range(len(heights))]
+
+    open_by_color = {}
+    first_empty = {} # Size -> first empty bottle of that size
+    for i, color in enumerate(tops):
+        if color is None:
+            first_empty.setdefault(capacities[i], i)
+        elif heights[i] < capacities[i]:
+            open_by_color.setdefault(color, []).append(i)
+    empties = list(first_empty.values())
+
+    for from_idx, color in enumerate(tops):
+        if color is None: continue
+        run = runs[from_idx]
+        size = capacities[from_idx]
+        if run == size and run == totals[color]: continue
+        if run == heights[from_idx] and size in first_empty:
+            # Only an empty bottle of another size changes anything
+            spare = [i for i in empties if capacities[i] != size]
+        else:
+            spare = empties
+        next_empty = 0
+        for to_idx in open_by_color.get(color, ()):
+            while next_empty < len(spare) and spare[next_empty] < to_idx:
+                empty = spare[next_empty]
+                yield from_idx, empty, min(run, capacities[empty]), run
+                next_empty += 1
+            if to_idx != from_idx:
+                yield from_idx, to_idx, min(run, capacities[to_idx] - heights[to_idx]), run
+        for empty in spare[next_empty:]:
+            yield from_idx, empty, min(run, capacities[empty]), run
+
+
+def apply_move(board, from_idx, to_idx, segments):
+    """Return a copy of the board after pouring ``segments`` between two bottles"""
+    child = board.copy()
+    child.pour(from_idx, to_idx, segments)
+    return child
+
+
+def heuristic(board):
+    # Each pour merges at most one pair of runs, and a solved board has exactly
+    # one run per colour, so this never overestimates the remaining moves.
+    # (With mixed sizes a colour can end up split over several bottles, so
+    # the estimate can be too high and the search is no longer optimal.)
+    runs = 0
+    colors = set()
+    for content in board.all_contents():
+        previous = None
+        for color in content:
+            if color != previous:
+                runs += 1
+                previous = color
+        colors.update(content)
+    return runs - len(colors)
+
+
+def canonical_key(state):
+    """Return a key shared by every bottle ordering of the same board.
+
+    ``state`` is a ``Board`` or a list of bottle contents.  Bottles are
+    interchangeable, so sorting their contents removes the ordering; all empty
+    bottles become the same ``b''`` entry.
+    """
+    if isinstance(state, Board):
+        return state.canonical_key()
+    return tuple(sorted(bytes(content) for content in state))
+
+
+class TranspositionTable:
+    """Bounded map from canonical board keys to the best known move count.
+
+    Once ``max_entries`` is reached the least recently used entry is evicted,
+    which can only cost a repeated expansion, never a wrong answer.
+    """
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        cost = self.entries.get(key)
+        if cost is not None:
+            self.entries.move_to_end(key)
+        return cost
+
+    def store(self, key, cost):
+        self.entries[key] = cost
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+# Expansions between checks of the cancel flag
+CANCEL_CHECK_INTERVAL = 256
+
+
+def solve(board, capacity=4, max_nodes=100000, weight=1.5, table=None, cancel=None, time_limit=None, partial=False):
+    """Find a short pour sequence that sorts the bottles.
+
+    ``board`` is a ``Board`` or a sequence of bottle contents, with
+    ``capacity`` one size for every bottle or a size per bottle.  Returns a
+    list of (from_index, to_index) moves, an empty list if the board is
+    already solved, or None if no solution exists (or none was found within
+    ``max_nodes`` expansions).  With ``weight=1`` the search is plain A* and
+    the result is optimal on boards of one bottle size; on mixed boards the
+    heuristic can overestimate, so the result is only short.  Larger weights
+    trade a few extra moves for a much smaller search.  ``table`` may be a
+    ``TranspositionTable`` to bound the memory used for duplicate detection.  ``cancel`` may be a
+    ``threading.Event``; once it is set the search gives up and returns None.
+
+    ``time_limit`` caps the search at that many seconds.  With ``partial``, a
+    search that runs out of nodes or time returns the moves towards the most
+    promising board it reached instead of None, so large boards still get a
+    useful first move.
+    """
+    if not isinstance(board, Board):
+        board = Board.from_contents(board, capacity)
+    start = board
+    if start.is_solved():
+        return []
+    if table is None:
+        table = TranspositionTable()
+    else:
+        table.clear()
+
+    # Weighted A*; ties prefer deeper nodes and the counter keeps ordering stable.
+    # Each node links to its parent, so the path survives table evictions.
+    counter = 0
+    start_h = heuristic(start)
+    open_heap = [(weight * start_h, 0, counter, start_h, start, None)]
+    table.store(start.canonical_key(), 0)
+    expanded = 0
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
+    closest = (start_h, None) # Lowest heuristic seen, for partial results
+
+    while open_heap and expanded < max_nodes:
+        _, cost, _, h, state, node = heapq.heappop(open_heap)
+        cost = -cost
+        best = table.get(state.canonical_key())
+        if best is not None and cost > best: continue
+        if state.is_solved():
+            return _build_path(node)
+        if h < closest[0]:
+            closest = (h, node)
+        expanded += 1
+        if cancel is not None and not expanded % CANCEL_CHECK_INTERVAL and cancel.is_set():
+            return None
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+
+        for from_idx, to_idx, segments, run in legal_moves(state):
+            child = apply_move(state, from_idx, to_idx, segments)
+            child_key = child.canonical_key()
+            child_cost = cost + 1
+            best = table.get(child_key)
+            if best is not None and best <= child_cost: continue
+            table.store(child_key, child_cost)
+            child_h = h
+            if not state.heights[to_idx]:
+                if segments < run: child_h += 1
+            elif segments == run:
+                child_h -= 1
+            counter += 1
+            heapq.heappush(open_heap, (child_cost + weight * child_h, -child_cost, counter, child_h, child, (node, from_idx, to_idx)))
+
+    if partial and closest[1] is not None:
+        return _build_path(closest[1])
+    return None
+
+
+def _build_path(node):
+    moves = []
+    while node is not None:
+        node, from_idx, to_idx = node
+        moves.append((from_idx, to_idx))
+    moves.reverse()
+    return moves
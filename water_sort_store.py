@@ -0,0 +1,87 @@
+"""Persistent high scores and level progress.
+
+``ScoreStore`` loads a small JSON file at startup.  ``save`` only hands a
+snapshot to a background writer thread and returns at once, so disk I/O never
+runs on the render loop; snapshots that arrive while a write is in progress
+are coalesced into the newest one.  Each write goes to a temporary file in the
+same directory, is fsynced and then renamed over the old file, so a crash
+leaves either the previous or the new contents on disk, never a torn file.
+"""
+import json
+import os
+import tempfile
+import threading
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.water_sort_scores.json')
+
+
+class ScoreStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.pending = None # Newest snapshot not yet written
+        self.closed = False
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write_loop, name='score-store', daemon=True)
+        self.writer.start()
+
+    def load(self):
+        """Return the stored data, or {} if there is none or it can't be read"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable score file {self.path}: {e}")
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def save(self, data):
+        """Queue ``data`` to be written; never blocks on disk"""
+        snapshot = json.dumps(data, indent=2) # Serialized now, so later changes don't leak in
+        with self.condition:
+            self.pending = snapshot
+            self.condition.notify()
+
+    def flush(self):
+        """Block until every queued snapshot is on disk"""
+        with self.condition:
+            while self.pending is not None:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.writer.join()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None: return # Closed with nothing left to write
+                snapshot = self.pending
+
+            try:
+                self.write(snapshot)
+            except OSError as e:
+                print(f"Could not save scores to {self.path}: {e}")
+
+            with self.condition:
+                if self.pending is snapshot:
+                    self.pending = None
+                self.condition.notify_all()
+
+    def write(self, snapshot):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.scores-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -1,17 +1,24 @@
+import argparse
+import colorsys
+from collections import deque
+
 import pygame
-import random
 import os
 import math
 
-# Initialize Pygame
-pygame.init()
-# pygame.mixer.init() # Initialize mixer for sounds
+from water_sort_animation import ARC_STEPS, AnimationScheduler, ease_in_out_cubic, ease_out_cubic, ease_out_quad, quadratic_arc
+from water_sort_core import LEVELS, GameCore
+from water_sort_board import MAX_CAPACITY, MIN_CAPACITY
+from water_sort_generator import CUSTOM_BOTTLES_RANGE, DEFAULT_CUSTOM_BOTTLES, capacity_range
+from water_sort_hints import HintWorker
+from water_sort_profiler import FrameProfiler
+from water_sort_render import DirtyRegions, GlyphAtlas, ParticleAtlas, StaticLayer, SurfaceCache, TextCache
+from water_sort_replay import GAME, HINT, NO_HINT, ReplayError, ReplayRecorder, apply_record, load_records
+from water_sort_store import DEFAULT_PATH, ScoreStore
 
 # Screen dimensions
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
-SCREEN = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Water Sort Puzzle v0.1.13 - almezali")
 
 # Colors (matching the HTML/CSS as much as possible)
 # These are the primary colors for the liquids
@@ -23,6 +30,8 @@ LIQUID_COLORS = [
     (255, 171, 0),   # color-5: #ffab00
     (0, 188, 212)    # color-6: #00bcd4
 ]
+# LIQUID_COLORS followed by generated colours for large boards; see liquid_color()
+PALETTE = list(LIQUID_COLORS)
 
 # UI Colors - Modern Android Material Design 3 inspired
 PRIMARY_COLOR = (103, 80, 164)  # Material Purple
@@ -36,8 +45,51 @@ OUTLINE_COLOR = (121, 116, 126)  # Material Outline
 
 # Game settings
 BOTTLE_WIDTH = 60
-BOTTLE_HEIGHT = 180
-LIQUID_SEGMENT_HEIGHT = 45 # Each segment is 25% of the bottle height
+BOTTLE_HEIGHT = 180 # Height of the largest bottles on a board; smaller ones are
+                    # shorter, so every segment on a board is the same height
+GLOW_PADDING = 10 # Room around a full-size bottle for its glow and shadow
+
+# Boards with more bottles than fit in one row are laid out as a grid of
+# scaled-down bottles inside this area
+MAX_ROW_BOTTLES = 9
+GRID_AREA = pygame.Rect(40, 335, SCREEN_WIDTH - 80, SCREEN_HEIGHT - 375)
+
+PROFILER_REFRESH_MS = 250 # How often the profiler overlay is redrawn
+
+# Rules, animation clocks and hint delivery advance in fixed steps, apart from
+# rendering.  A frame runs every step that is due, at most MAX_FRAMESKIP of
+# them; past that the simulation clock jumps ahead, so a stall never holds
+# back the end of a pour.
+UPDATE_STEP_MS = 10
+MAX_FRAMESKIP = 5
+
+HINT_READY = pygame.event.custom_type() # Posted by the hint worker thread
+
+# Animation kinds and their durations in milliseconds
+POUR, POINTS, PULSE = 'pour', 'points', 'pulse'
+POUR_DURATION = 800
+POINTS_DURATION = 1500
+PULSE_DURATION = 400
+PULSE_GROWTH = 8 # How far a selection pulse ring spreads, in pixels
+GLOW_ALPHA_STEP = 8 # Points popup glow fades in steps of this much alpha
+TRAIL_PARTICLES = 24 # Most particles in a pour's trail
+TRAIL_SPACING = 1.5 # Arc steps between neighbouring trail particles
+
+def liquid_color(index):
+    """RGB colour of liquid ``index``: the hand-picked colours, then generated ones"""
+    while index >= len(PALETTE):
+        # Golden-ratio hue steps keep neighbouring colours apart; every six
+        # colours the saturation and brightness change so hues can repeat
+        i = len(PALETTE)
+        hue = (i * 0.618033988749895) % 1.0
+        saturation = (0.85, 0.55, 1.0)[i // 6 % 3]
+        value = (0.95, 0.75, 0.55)[i // 18 % 3]
+        PALETTE.append(tuple(round(c * 255) for c in colorsys.hsv_to_rgb(hue, saturation, value)))
+    return PALETTE[index]
+
+def glow_padding(width):
+    # Glow and shadow margin, scaled with the bottle
+    return max(3, round(GLOW_PADDING * width / BOTTLE_WIDTH))
 
 def create_glassmorphism_surface(size, alpha=100, border_alpha=150):
     """Create a glassmorphism effect surface"""
@@ -51,349 +103,359 @@ def draw_glassmorphism_rect(surface, rect, alpha=100, border_alpha=150, border_r
     pygame.draw.rect(glass_surface, (255, 255, 255, border_alpha), glass_surface.get_rect(), 2, border_radius=border_radius)
     surface.blit(glass_surface, rect.topleft)
 
+def draw_background_gradient(surface):
+    """Draw the background gradient (modern Android-like with multiple color stops)"""
+    width, height = surface.get_size()
+    for y in range(height):
+        if y < height * 0.3:
+            # Top section: Light purple to blue
+            ratio = y / (height * 0.3)
+            color_start = (230, 220, 255)  # Light purple
+            color_end = (200, 230, 255)    # Light blue
+        elif y < height * 0.7:
+            # Middle section: Light blue to light green
+            ratio = (y - height * 0.3) / (height * 0.4)
+            color_start = (200, 230, 255)  # Light blue
+            color_end = (220, 255, 230)    # Light green
+        else:
+            # Bottom section: Light green to light yellow
+            ratio = (y - height * 0.7) / (height * 0.3)
+            color_start = (220, 255, 230)  # Light green
+            color_end = (255, 250, 220)    # Light yellow
+
+        r = int(color_start[0] + (color_end[0] - color_start[0]) * ratio)
+        g = int(color_start[1] + (color_end[1] - color_start[1]) * ratio)
+        b = int(color_start[2] + (color_end[2] - color_start[2]) * ratio)
+
+        pygame.draw.line(surface, (r, g, b), (0, y), (width, y))
+
 class Bottle:
-    def __init__(self, x, y, content, max_capacity=4):
+    """Rendering view of one bottle of a packed Board"""
+    __slots__ = ('board', 'index', 'rect', 'is_selected', 'is_hinted')
+
+    def __init__(self, board, index, x=0, y=0):
+        self.board = board
+        self.index = index
         self.rect = pygame.Rect(x, y, BOTTLE_WIDTH, BOTTLE_HEIGHT)
-        self.content = content # List of color indices
-        self.max_capacity = max_capacity
         self.is_selected = False
         self.is_hinted = False
 
-    def draw(self, screen):
+    @property
+    def content(self):
+        return self.board.contents(self.index) # List of color indices
+
+    @property
+    def max_capacity(self):
+        return self.board.capacities[self.index]
+
+    def draw_rect(self):
+        # Area covered by the bottle sprite: glow margin, neck and shadow included
+        padding = glow_padding(self.rect.width)
+        return self.rect.inflate(2 * padding, 2 * padding)
+
+    def segment_height(self):
+        return self.rect.height / self.max_capacity
+
+    def sprite_key(self):
+        return (tuple(self.content), self.is_selected, self.is_hinted, self.max_capacity, self.rect.size)
+
+    @staticmethod
+    def render_sprite(key):
+        """Draw a bottle described by a sprite_key() into a transparent surface.
+
+        The sprite uses premultiplied alpha, so layering its translucent parts
+        here gives the same result as drawing them straight onto the screen;
+        blit it with BLEND_PREMULTIPLIED.
+        """
+        content, is_selected, is_hinted, capacity, (width, height) = key
+        scale = width / BOTTLE_WIDTH
+        padding = glow_padding(width)
+        radius = max(2, round(15 * scale))
+        sprite = pygame.Surface((width + 2 * padding, height + 2 * padding), pygame.SRCALPHA)
+        rect = pygame.Rect(padding, padding, width, height)
+
         # Draw bottle shadow for depth
-        shadow_rect = pygame.Rect(self.rect.x + 3, self.rect.y + 3, BOTTLE_WIDTH, BOTTLE_HEIGHT)
+        offset = max(1, round(3 * scale))
+        shadow_rect = pygame.Rect(rect.x + offset, rect.y + offset, width, height)
         shadow_surface = pygame.Surface(shadow_rect.size, pygame.SRCALPHA)
         shadow_surface.fill((0, 0, 0, 30))
-        pygame.draw.rect(shadow_surface, (0, 0, 0, 30), shadow_surface.get_rect(), border_radius=15)
-        screen.blit(shadow_surface, shadow_rect.topleft)
+        pygame.draw.rect(shadow_surface, (0, 0, 0, 30), shadow_surface.get_rect(), border_radius=radius)
+        sprite.blit(shadow_surface.premul_alpha(), shadow_rect.topleft, special_flags=pygame.BLEND_PREMULTIPLIED)
 
         # Draw bottle body (glass effect with glassmorphism)
-        bottle_surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        border = max(1, round(3 * scale))
+        bottle_surface = pygame.Surface(rect.size, pygame.SRCALPHA)
         bottle_surface.fill((255, 255, 255, 60)) # Very light transparent white for glass
-        pygame.draw.rect(bottle_surface, (255, 255, 255, 100), bottle_surface.get_rect(), 3, border_radius=15) # Lighter border
-        screen.blit(bottle_surface, self.rect.topleft)
+        pygame.draw.rect(bottle_surface, (255, 255, 255, 100), bottle_surface.get_rect(), border, border_radius=radius) # Lighter border
+        sprite.blit(bottle_surface.premul_alpha(), rect.topleft, special_flags=pygame.BLEND_PREMULTIPLIED)
 
         # Draw bottle neck with gradient effect
-        neck_rect = pygame.Rect(self.rect.x + 10, self.rect.y - 10, BOTTLE_WIDTH - 20, 10)
-        neck_surface = pygame.Surface(neck_rect.size, pygame.SRCALPHA)
-        neck_surface.fill(PRIMARY_COLOR)
-        pygame.draw.rect(neck_surface, PRIMARY_COLOR, neck_surface.get_rect(), border_top_left_radius=10, border_top_right_radius=10)
-        screen.blit(neck_surface, neck_rect.topleft)
-
-        # Draw liquid segments with enhanced visual effects
-        for i, color_index in enumerate(self.content):
-            segment_y = self.rect.y + self.rect.height - (i + 1) * LIQUID_SEGMENT_HEIGHT
-            segment_rect = pygame.Rect(self.rect.x + 3, segment_y, BOTTLE_WIDTH - 6, LIQUID_SEGMENT_HEIGHT)
-            
-            # Add gradient effect to liquid
-            liquid_color = LIQUID_COLORS[color_index]
-            darker_color = tuple(max(0, c - 30) for c in liquid_color)
-            
+        neck_rect = pygame.Rect(rect.x + padding, rect.y - padding, width - 2 * padding, padding)
+        sprite.fill(PRIMARY_COLOR, neck_rect)
+
+        # Draw liquid segments with enhanced visual effects; segment edges are
+        # rounded from exact fractions so they tile without gaps at any scale
+        def segment_top(level):
+            return rect.bottom - round(level * height / capacity)
+
+        for i, color_index in enumerate(content):
+            segment_y = segment_top(i + 1)
+            segment_rect = pygame.Rect(rect.x + border, segment_y, width - 2 * border, segment_top(i) - segment_y)
+
             # Draw main liquid segment
-            pygame.draw.rect(screen, liquid_color, segment_rect)
-            
+            liquid = liquid_color(color_index)
+            pygame.draw.rect(sprite, liquid, segment_rect)
+
             # Add highlight on the left side for 3D effect
-            highlight_rect = pygame.Rect(segment_rect.x, segment_y, 8, LIQUID_SEGMENT_HEIGHT)
-            highlight_color = tuple(min(255, c + 40) for c in liquid_color)
-            pygame.draw.rect(screen, highlight_color, highlight_rect)
-            
+            highlight_rect = pygame.Rect(segment_rect.x, segment_y, max(1, round(8 * scale)), segment_rect.height)
+            highlight_color = tuple(min(255, c + 40) for c in liquid)
+            pygame.draw.rect(sprite, highlight_color, highlight_rect)
+
             # Add a slight curve at the top of the liquid if it's the topmost segment
-            if i == len(self.content) - 1:
-                ellipse_rect = pygame.Rect(self.rect.x + 3, segment_y - 5, BOTTLE_WIDTH - 6, 10)
-                pygame.draw.ellipse(screen, liquid_color, ellipse_rect)
-
-        # Draw selection highlight with glow effect
-        if self.is_selected:
-            glow_surface = pygame.Surface((BOTTLE_WIDTH + 20, BOTTLE_HEIGHT + 20), pygame.SRCALPHA)
-            for i in range(10):
-                alpha = 255 - (i * 25)
-                color = (*ACCENT_COLOR, alpha)
-                pygame.draw.rect(glow_surface, color, (10 - i, 10 - i, BOTTLE_WIDTH + 2*i, BOTTLE_HEIGHT + 2*i), 2, border_radius=15 + i)
-            screen.blit(glow_surface, (self.rect.x - 10, self.rect.y - 10))
-        elif self.is_hinted:
-            glow_surface = pygame.Surface((BOTTLE_WIDTH + 20, BOTTLE_HEIGHT + 20), pygame.SRCALPHA)
-            for i in range(10):
-                alpha = 255 - (i * 25)
-                color = (*SUCCESS_COLOR, alpha)
-                pygame.draw.rect(glow_surface, color, (10 - i, 10 - i, BOTTLE_WIDTH + 2*i, BOTTLE_HEIGHT + 2*i), 2, border_radius=15 + i)
-            screen.blit(glow_surface, (self.rect.x - 10, self.rect.y - 10))
+            if i == len(content) - 1:
+                curve = max(2, round(10 * scale))
+                ellipse_rect = pygame.Rect(segment_rect.x, segment_y - curve // 2, segment_rect.width, curve)
+                pygame.draw.ellipse(sprite, liquid, ellipse_rect)
+
+        # Draw selection (or hint) highlight with glow effect
+        if is_selected or is_hinted:
+            glow_color = ACCENT_COLOR if is_selected else SUCCESS_COLOR
+            glow_surface = pygame.Surface(sprite.get_size(), pygame.SRCALPHA)
+            for i in range(padding):
+                alpha = 255 - (i * 250 // padding)
+                color = (*glow_color, alpha)
+                pygame.draw.rect(glow_surface, color, (padding - i, padding - i, width + 2*i, height + 2*i), 2, border_radius=radius + i)
+            sprite.blit(glow_surface.premul_alpha(), (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+
+        return sprite
 
     def get_top_color(self):
-        if not self.content: return None
-        return self.content[-1]
+        return self.board.top_color(self.index)
 
     def get_top_color_count(self):
-        if not self.content: return 0
-        top_color = self.get_top_color()
-        count = 0
-        for color in reversed(self.content):
-            if color == top_color:
-                count += 1
-            else:
-                break
-        return count
+        return self.board.top_run(self.index)
 
     def is_full(self):
-        return len(self.content) == self.max_capacity
+        return self.board.is_full(self.index)
 
     def is_empty(self):
-        return len(self.content) == 0
+        return self.board.is_empty(self.index)
 
     def is_complete(self):
-        if self.is_empty(): return False
-        if len(self.content) < self.max_capacity: return False
-        first_color = self.content[0]
-        return all(color == first_color for color in self.content)
-
-class WaterSortGame:
-    def __init__(self):
-        self.selected_bottle = None # Index of the selected bottle
-        self.moves = 0
-        self.game_started = False
-        self.current_level = 'easy'
+        return self.board.is_complete(self.index)
+
+class WaterSortGame(GameCore):
+    def __init__(self, screen, fps=60, idle_sleep=True, show_profiler=False, profile_dump=None, recorder=None, store=None,
+                 level='easy', custom_bottles=DEFAULT_CUSTOM_BOTTLES, capacity=4):
+        self.screen = screen
+        self.fps = fps # Frame-rate cap while animating, 0 for uncapped
+        self.idle_sleep = idle_sleep # Block on input while nothing moves
+
+        # Per-stage frame timings; F3 toggles the overlay, profile_dump is a
+        # .csv or .json path that receives every frame's record on exit
+        self.profiler = FrameProfiler(record=profile_dump is not None)
+        self.profile_dump = profile_dump
+        self.show_profiler = False
+        self.profiler_overlay = None
+        self.profiler_overlay_time = 0
         self.bottles = []
-        self.score = 0
-        self.high_scores = {'easy': 0, 'medium': 0, 'hard': 0}
-        self.level_progresses = {'easy': 0, 'medium': 0, 'hard': 0}
 
         self.font = pygame.font.Font(None, 24)
         self.large_font = pygame.font.Font(None, 36)
         self.medium_font = pygame.font.Font(None, 28)
         self.small_font = pygame.font.Font(None, 20)
 
-        self.pouring_animation = None # (from_bottle_idx, to_bottle_idx, segments_to_pour, color_to_pour, start_time)
-        self.points_animation = [] # (text, x, y, start_time, color)
-        self.win_modal_active = False
-
-        self.initialize_game()
-
-    def initialize_game(self):
-        num_bottles, num_colors = 0, 0
-        if self.current_level == 'easy':
-            num_bottles = 5  # 4 color bottles + 1 empty
-            num_colors = 3
-        elif self.current_level == 'medium':
-            num_bottles = 7  # 5 color bottles + 2 empty
-            num_colors = 4
-        elif self.current_level == 'hard':
-            num_bottles = 9  # 6 color bottles + 3 empty
-            num_colors = 5
-
-        # Create color segments
-        color_segments = []
-        for i in range(num_colors):
-            for _ in range(4):
-                color_segments.append(i)
-        random.shuffle(color_segments)
+        # Simulation clock, moved on UPDATE_STEP_MS at a time by advance(), and
+        # how far the wall clock is past its last step
+        self.sim_time = pygame.time.get_ticks()
+        self.update_lag = 0
 
-        self.bottles = []
-        # Distribute colors into bottles
-        for i in range(num_colors):
-            bottle_content = []
-            for _ in range(4):
-                if color_segments: # Ensure there are segments to pop
-                    bottle_content.append(color_segments.pop())
-            self.bottles.append(Bottle(0, 0, bottle_content))
-
-        # Add empty bottles
-        for _ in range(num_bottles - num_colors):
-            self.bottles.append(Bottle(0, 0, []))
-        random.shuffle(self.bottles) # Shuffle bottles to randomize empty bottle positions
+        # Pours, points and selection pulses, all timed from the simulation
+        # clock. Payloads: pour (from, to, segments, color, arc, trail),
+        # points (text, x, y, color), pulse bottle index
+        self.animations = AnimationScheduler(lambda: self.sim_time)
+        self.win_modal_active = False
+        self.frame_time = self.sim_time # Time shared by every draw call of a frame
+
+        # Screen areas to repaint on the next frame, fed by state changes
+        self.dirty = DirtyRegions(screen.get_rect())
+
+        # Bottle sprites keyed by content and highlight state
+        self.bottle_sprites = SurfaceCache(Bottle.render_sprite, max_entries=256)
+
+        # Pour trail particles per colour, size and fade
+        self.particles = ParticleAtlas()
+
+        # Rendered labels, plus digit glyphs for the counters
+        self.text_cache = TextCache()
+        self.score_digits = GlyphAtlas(self.medium_font, ACCENT_COLOR)
+        self.moves_digits = GlyphAtlas(self.medium_font, ON_SURFACE_COLOR)
+
+        # Gradient, containers, title and button chrome are drawn once into
+        # these layers instead of every frame
+        self.gradient_layer = StaticLayer(draw_background_gradient)
+        self.static_layer = StaticLayer(self.draw_static_ui)
+
+        # Records of a replay log still to be played, and the speed to play them at
+        self.replay_records = deque()
+        self.replay_speed = 1.0
+        self.replay_start = 0
+
+        super().__init__(level, recorder=recorder, store=store, custom_bottles=custom_bottles, capacity=capacity)
+        # Hints are searched on a worker thread; it posts HINT_READY when done
+        # to wake the loop, and the next update step delivers the result
+        self.hint_worker = HintWorker(notify=lambda: pygame.event.post(pygame.event.Event(HINT_READY)))
+        self.draw_background(screen) # Lays out the rects used by draw_ui
+        if show_profiler:
+            self.toggle_profiler()
+
+    def initialize_game(self, seed=None):
+        super().initialize_game(seed)
+        self.bottles = [Bottle(self.board, i) for i in range(len(self.board))]
+        # Room for every bottle's common sprites on large boards
+        self.bottle_sprites.max_entries = max(256, 4 * len(self.bottles))
 
         # Adjust bottle positions dynamically
         self.arrange_bottles()
 
-        self.selected_bottle = None
-        self.moves = 0
-        self.game_started = False
-        self.score = 0
+        # Their bottle indices belong to the old board
+        self.animations.cancel(POUR)
+        self.animations.cancel(PULSE)
         self.win_modal_active = False
+        self.dirty.mark_all()
 
     def arrange_bottles(self):
-        total_width = len(self.bottles) * (BOTTLE_WIDTH + 20) - 20 # 20px padding between bottles
-        start_x = (SCREEN_WIDTH - total_width) // 2
+        # Bottles stand on a common floor, each as tall as its share of the
+        # largest capacity on the board
+        largest = max(self.board.capacities)
+        if len(self.bottles) <= MAX_ROW_BOTTLES:
+            total_width = len(self.bottles) * (BOTTLE_WIDTH + 20) - 20 # 20px padding between bottles
+            start_x = (SCREEN_WIDTH - total_width) // 2
+            for i, bottle in enumerate(self.bottles):
+                bottle.rect.height = round(BOTTLE_HEIGHT * bottle.max_capacity / largest)
+                bottle.rect.x = start_x + i * (BOTTLE_WIDTH + 20)
+                bottle.rect.bottom = SCREEN_HEIGHT - 50 # Position from bottom
+            return
+
+        # Grid: pick the row count that gives the largest bottles in GRID_AREA
+        count = len(self.bottles)
+        best_scale, best_rows = 0, 1
+        for rows in range(1, count + 1):
+            columns = -(-count // rows)
+            scale = min(1, GRID_AREA.width / (columns * (BOTTLE_WIDTH + 20)), GRID_AREA.height / (rows * (BOTTLE_HEIGHT + 30)))
+            if scale > best_scale:
+                best_scale, best_rows = scale, rows
+        columns = -(-count // best_rows)
+        width = max(6, int(BOTTLE_WIDTH * best_scale))
+        height = max(12, int(BOTTLE_HEIGHT * best_scale))
+        cell_width = GRID_AREA.width / columns
+        cell_height = GRID_AREA.height / best_rows
         for i, bottle in enumerate(self.bottles):
-            bottle.rect.x = start_x + i * (BOTTLE_WIDTH + 20)
-            bottle.rect.y = SCREEN_HEIGHT - BOTTLE_HEIGHT - 50 # Position from bottom
+            row, column = divmod(i, columns)
+            bottle.rect.size = (width, round(height * bottle.max_capacity / largest))
+            bottle.rect.x = int(GRID_AREA.x + column * cell_width + (cell_width - width) / 2)
+            # The largest bottles are centred in their cells, counting the neck drawn above the rect
+            bottle.rect.bottom = int(GRID_AREA.y + row * cell_height + (cell_height - height + glow_padding(width)) / 2) + height
 
     def start_game(self):
-        self.game_started = True
+        super().start_game()
+        self.dirty.mark_all() # The start button lives in the static layer
 
-    def new_game(self):
-        self.initialize_game()
+    def sync_bottle_flags(self):
+        # Mirror the core's selection and hint onto the bottle views
+        hint_move = self.hint_move or ()
+        for i, bottle in enumerate(self.bottles):
+            is_selected = (i == self.selected_bottle)
+            is_hinted = (i in hint_move)
+            if bottle.is_selected != is_selected or bottle.is_hinted != is_hinted:
+                bottle.is_selected = is_selected
+                bottle.is_hinted = is_hinted
+                self.dirty.mark(bottle.draw_rect())
+                if is_selected:
+                    self.animations.start(PULSE, PULSE_DURATION, i, ease_out_quad)
 
     def handle_click(self, pos):
         if self.win_modal_active: # Prevent clicks when modal is active
             return
 
-        if not self.game_started:
-            # In Pygame, this would be a UI message, for now just print
-            print("Please start the game first!") 
-            return
-
-        # Remove any hint highlights
-        for bottle in self.bottles:
-            bottle.is_hinted = False
-
         clicked_bottle_index = None
         for i, bottle in enumerate(self.bottles):
             if bottle.rect.collidepoint(pos):
                 clicked_bottle_index = i
                 break
 
-        if clicked_bottle_index is None: # Clicked outside bottles
-            if self.selected_bottle is not None:
-                self.bottles[self.selected_bottle].is_selected = False
-                self.selected_bottle = None
-            return
-
-        if self.selected_bottle is None:
-            # Select this bottle if it's not empty
-            if not self.bottles[clicked_bottle_index].is_empty():
-                self.selected_bottle = clicked_bottle_index
-                self.bottles[self.selected_bottle].is_selected = True
-        else:
-            # Try to pour from selected bottle to this one
-            if self.selected_bottle != clicked_bottle_index:
-                if self.pour_liquid(self.selected_bottle, clicked_bottle_index):
-                    self.moves += 1
-                    # Check for win condition
-                    if self.check_win_condition():
-                        self.handle_level_complete()
-            
-            # Deselect the bottle
-            self.bottles[self.selected_bottle].is_selected = False
-            self.selected_bottle = None
+        self.select_bottle(clicked_bottle_index)
+        self.sync_bottle_flags()
 
     def pour_liquid(self, from_index, to_index):
-        from_bottle = self.bottles[from_index]
-        to_bottle = self.bottles[to_index]
-
-        if from_bottle.is_empty(): return False
-        if to_bottle.is_full(): return False
-
-        color_to_pour = from_bottle.get_top_color()
-
-        if not to_bottle.is_empty() and to_bottle.get_top_color() != color_to_pour:
-            return False # Can't mix different colors
-
-        segments_to_pour = from_bottle.get_top_color_count()
-        segments_to_pour = min(segments_to_pour, to_bottle.max_capacity - len(to_bottle.content))
-
-        if segments_to_pour == 0: return False
-
-        # Start pouring animation
-        self.pouring_animation = (from_index, to_index, segments_to_pour, color_to_pour, pygame.time.get_ticks())
+        segments_to_pour = self.board.pour_amount(from_index, to_index)
+        color_to_pour = self.board.top_color(from_index)
+        if not super().pour_liquid(from_index, to_index): return False
+
+        # Start pouring animation; the pour itself is already complete and the
+        # animation only represents it visually.  Its path and sprites are
+        # looked up once here, so every frame of it is just blits.
+        arc, radius = self.pour_arc(from_index, to_index)
+        # Small bottles get a shorter trail; their particles would only overlap
+        trail = self.particles.trail(liquid_color(color_to_pour), radius, min(TRAIL_PARTICLES, 2 * radius))
+        self.animations.start(POUR, POUR_DURATION, (from_index, to_index, segments_to_pour, color_to_pour, arc, trail), ease_in_out_cubic)
         # self.sound_manager.play_pour()
 
-        # Instead of using a timer, we'll directly complete the pour here
-        # and rely on the animation to visually represent the delay.
-        # This simplifies the logic and avoids the IndexError.
-        self.complete_pour(from_index, to_index, segments_to_pour)
-
+        self.dirty.mark(self.bottles[from_index].draw_rect())
+        self.dirty.mark(self.bottles[to_index].draw_rect())
+        self.dirty.mark(self.moves_counter_rect())
         return True
 
-    def complete_pour(self, from_index, to_index, segments_to_pour):
-        from_bottle = self.bottles[from_index]
-        to_bottle = self.bottles[to_index]
-
-        # Ensure there's actually liquid to pour before popping
-        if from_bottle.is_empty():
-            return # Should not happen if pour_liquid checks are correct, but as a safeguard
-
-        for _ in range(segments_to_pour):
-            color = from_bottle.content.pop()
-            to_bottle.content.append(color)
-        
-        self.update_score(segments_to_pour)
-        self.pouring_animation = None # End animation
-
-        if to_bottle.is_complete():
-            # self.sound_manager.play_complete()
-            pass # Placeholder for sound
-
-    def check_win_condition(self):
-        # Game is won when each bottle either has 4 segments of the same color or is empty
-        return all(bottle.is_complete() or bottle.is_empty() for bottle in self.bottles)
+    def undo(self):
+        return self.redraw_after(super().undo())
+
+    def redo(self):
+        return self.redraw_after(super().redo())
+
+    def redraw_after(self, move):
+        # Undo and redo change two bottles, the counters and the selection
+        if move is None: return None
+        # Running pours show moves that no longer match the board
+        for tween in self.animations.active:
+            if tween.kind == POUR:
+                self.dirty.mark(self.pour_rect(tween.payload))
+        self.animations.cancel(POUR)
+        self.dirty.mark(self.bottles[move[0]].draw_rect())
+        self.dirty.mark(self.bottles[move[1]].draw_rect())
+        self.dirty.mark(self.moves_counter_rect())
+        self.dirty.mark(self.score_container_rect)
+        self.sync_bottle_flags()
+        return move
 
     def handle_level_complete(self):
-        if self.score > self.high_scores[self.current_level]:
-            self.high_scores[self.current_level] = self.score
-            # TODO: Save high scores (e.g., to a file)
-        
-        self.level_progresses[self.current_level] = min(100, self.level_progresses[self.current_level] + 20)
-        # TODO: Save level progress
-
+        super().handle_level_complete()
         self.show_win_modal()
 
     def update_score(self, segments_poured):
-        base_points = 10
-        multiplier = 1
-        if self.current_level == 'medium': multiplier = 1.5
-        if self.current_level == 'hard': multiplier = 2
-
-        bonus = segments_poured * 5 if segments_poured > 1 else 0
-        points_earned = round((base_points * segments_poured * multiplier) + bonus)
-        self.score += points_earned
-        
+        points_earned = super().update_score(segments_poured)
+
         # Show points animation
         score_display_x = SCREEN_WIDTH // 2
         score_display_y = 200
-        self.points_animation.append((f"+{points_earned}", score_display_x, score_display_y, pygame.time.get_ticks(), SUCCESS_COLOR))
-
-    def set_level(self, level):
-        self.current_level = level
-        self.new_game()
+        self.animations.start(POINTS, POINTS_DURATION, (f"+{points_earned}", score_display_x, score_display_y, SUCCESS_COLOR), ease_out_cubic)
+        self.dirty.mark(self.score_container_rect)
+        return points_earned
 
     def show_hint(self):
-        if not self.game_started:
-            print("Please start the game first!")
-            return
+        hint_move = super().show_hint()
+        self.sync_bottle_flags() # Drops the old highlight while the search runs
+        return hint_move
 
-        hint_found = False
+    def poll_hint(self):
+        done = super().poll_hint()
+        if done:
+            self.sync_bottle_flags()
+        return done
 
-        # First, try to find a move that completes a bottle
-        for from_idx, from_bottle in enumerate(self.bottles):
-            if from_bottle.is_empty(): continue
-            
-            top_color = from_bottle.get_top_color()
-            same_color_count = from_bottle.get_top_color_count()
-            
-            for to_idx, to_bottle in enumerate(self.bottles):
-                if from_idx == to_idx: continue
-                
-                # Check if this move would complete a bottle of the same color
-                if not to_bottle.is_empty() and to_bottle.get_top_color() == top_color and \
-                   not to_bottle.is_complete() and \
-                   len(to_bottle.content) + same_color_count <= to_bottle.max_capacity and \
-                   all(color == top_color for color in to_bottle.content):
-                    
-                    self.bottles[from_idx].is_hinted = True
-                    self.bottles[to_idx].is_hinted = True
-                    hint_found = True
-                    return
-
-        # If no completing move, find any valid move
-        if not hint_found:
-            for from_idx, from_bottle in enumerate(self.bottles):
-                if from_bottle.is_empty(): continue
-                
-                top_color = from_bottle.get_top_color()
-                
-                for to_idx, to_bottle in enumerate(self.bottles):
-                    if from_idx == to_idx: continue
-                    
-                    # Check if we can pour into this bottle
-                    if to_bottle.is_empty() or (to_bottle.get_top_color() == top_color and not to_bottle.is_full()):
-                        self.bottles[from_idx].is_hinted = True
-                        self.bottles[to_idx].is_hinted = True
-                        hint_found = True
-                        return
-        
-        if not hint_found:
-            print("No valid moves found!") # In Pygame, this would be a UI message
+    def draw_static_ui(self, screen):
+        # Everything here is baked into self.static_layer; see static_layer_key()
+        screen.blit(self.gradient_layer.get(screen.get_size()), (0, 0))
 
-    def draw_ui(self, screen):
         # Draw main container background (glassmorphism effect)
         main_container_rect = pygame.Rect(30, 30, SCREEN_WIDTH - 60, SCREEN_HEIGHT - 60)
         draw_glassmorphism_rect(screen, main_container_rect, alpha=80, border_alpha=120, border_radius=25)
@@ -438,30 +500,29 @@ class WaterSortGame:
         # Display Level, Score, High Score
         # Level
         level_label = self.small_font.render("Level", True, ON_SURFACE_COLOR)
-        level_value = self.medium_font.render(self.current_level.capitalize(), True, PRIMARY_COLOR)
+        level_name = self.current_level.capitalize()
+        if self.current_level == 'custom':
+            level_name += f" ({self.custom_bottles})"
+        level_value = self.medium_font.render(level_name, True, PRIMARY_COLOR)
         screen.blit(level_label, (score_container_rect.x + 20, score_container_rect.y + 10))
         screen.blit(level_value, (score_container_rect.x + 20, score_container_rect.y + 35))
 
         # Score
         score_label = self.small_font.render("Score", True, ON_SURFACE_COLOR)
-        score_value = self.medium_font.render(str(self.score), True, ACCENT_COLOR)
         screen.blit(score_label, (score_container_rect.centerx - score_label.get_width() // 2, score_container_rect.y + 10))
-        screen.blit(score_value, (score_container_rect.centerx - score_value.get_width() // 2, score_container_rect.y + 35))
 
         # High Score
         high_score_label = self.small_font.render("High Score", True, ON_SURFACE_COLOR)
-        high_score_value = self.medium_font.render(str(self.high_scores[self.current_level]), True, ACCENT_COLOR)
         screen.blit(high_score_label, (score_container_rect.right - high_score_label.get_width() - 20, score_container_rect.y + 10))
-        screen.blit(high_score_value, (score_container_rect.right - high_score_value.get_width() - 20, score_container_rect.y + 35))
 
         # Level selector
         level_buttons_y = score_container_rect.y + score_container_rect.height + 20
         level_button_width = 80
         level_button_height = 35
         level_gap = 10
-        start_level_x = (SCREEN_WIDTH - (3 * level_button_width + 2 * level_gap)) // 2
+        levels = LEVELS
+        start_level_x = (SCREEN_WIDTH - (len(levels) * level_button_width + (len(levels) - 1) * level_gap)) // 2
 
-        levels = ['easy', 'medium', 'hard']
         for i, level in enumerate(levels):
             level_rect = pygame.Rect(start_level_x + i * (level_button_width + level_gap), level_buttons_y, level_button_width, level_button_height)
             is_active = (self.current_level == level)
@@ -476,77 +537,142 @@ class WaterSortGame:
             if level == 'easy': self.easy_level_rect = level_rect
             elif level == 'medium': self.medium_level_rect = level_rect
             elif level == 'hard': self.hard_level_rect = level_rect
+            elif level == 'custom': self.custom_level_rect = level_rect
+
+        # Store layout for the dynamic parts drawn by draw_ui
+        self.score_container_rect = score_container_rect
+        self.moves_counter_y = level_buttons_y + level_button_height + 15
+
+    def static_layer_key(self):
+        # The static layer shows the start button state and the active level
+        return (self.current_level, self.custom_bottles, self.game_started)
+
+    def moves_counter_rect(self):
+        return pygame.Rect(0, self.moves_counter_y, SCREEN_WIDTH, self.medium_font.get_height())
+
+    def pour_rect(self, pour):
+        # Bounds of the arc drawn by draw_pouring_animation, trail radius included
+        from_idx, to_idx = pour[:2]
+        from_rect = self.bottles[from_idx].rect
+        to_rect = self.bottles[to_idx].rect
+        scale = from_rect.width / BOTTLE_WIDTH
+        radius = math.ceil(12 * scale)
+        arc = math.ceil(50 * scale)
+        left = min(from_rect.left, to_rect.left) - radius
+        top = min(from_rect.top, to_rect.top) - arc - radius
+        right = max(from_rect.right, to_rect.right) + radius
+        bottom = max(from_rect.bottom, to_rect.bottom) + radius
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def pulse_rect(self, index):
+        return self.bottles[index].draw_rect().inflate(2 * PULSE_GROWTH + 4, 2 * PULSE_GROWTH + 4)
+
+    def mark_animations(self):
+        # Running animations repaint their whole travel area every frame,
+        # including on the frame they finish, which erases them
+        for tween in self.animations.active:
+            if tween.kind == POUR:
+                self.dirty.mark(self.pour_rect(tween.payload))
+            elif tween.kind == POINTS:
+                text, x, y, color = tween.payload
+                text_width, text_height = self.medium_font.size(text)
+                self.dirty.mark(pygame.Rect(x - text_width // 2, y - 60, text_width + 1, text_height + 61))
+            elif tween.kind == PULSE:
+                self.dirty.mark(self.pulse_rect(tween.payload))
+
+    def draw_background(self, screen):
+        screen.blit(self.static_layer.get(screen.get_size(), self.static_layer_key()), (0, 0))
+
+    def draw_ui(self, screen):
+        score_container_rect = self.score_container_rect
+
+        # Score
+        score_text = str(self.score)
+        score_width = self.score_digits.size(score_text)[0]
+        self.score_digits.draw(screen, score_text, (score_container_rect.centerx - score_width // 2, score_container_rect.y + 35))
+
+        # High Score
+        high_score_text = str(self.high_score())
+        high_score_width = self.score_digits.size(high_score_text)[0]
+        self.score_digits.draw(screen, high_score_text, (score_container_rect.right - high_score_width - 20, score_container_rect.y + 35))
 
         # Moves Counter
-        moves_counter_text = self.medium_font.render(f"Moves: {self.moves}", True, ON_SURFACE_COLOR)
-        screen.blit(moves_counter_text, (SCREEN_WIDTH // 2 - moves_counter_text.get_width() // 2, level_buttons_y + level_button_height + 15))
+        moves_label = self.text_cache.text(self.medium_font, "Moves: ", ON_SURFACE_COLOR)
+        moves_text = str(self.moves)
+        moves_counter_width = moves_label.get_width() + self.moves_digits.size(moves_text)[0]
+        moves_counter_x = SCREEN_WIDTH // 2 - moves_counter_width // 2
+        screen.blit(moves_label, (moves_counter_x, self.moves_counter_y))
+        self.moves_digits.draw(screen, moves_text, (moves_counter_x + moves_label.get_width(), self.moves_counter_y))
 
         # Draw points animations
-        current_time = pygame.time.get_ticks()
-        animations_to_remove = []
-        for i, (text, x, y, start_time, color) in enumerate(self.points_animation):
-            elapsed_time = current_time - start_time
-            if elapsed_time < 1500: # Animation duration 1.5 seconds
-                offset_y = elapsed_time / 1500 * 60 # Move up 60 pixels
-                alpha = 255 - (elapsed_time / 1500 * 255) # Fade out
-                
-                # Create animated text with glow effect
-                points_surface = self.medium_font.render(text, True, color)
-                glow_surface = self.medium_font.render(text, True, (255, 255, 255, int(alpha // 2)))
-                screen.blit(glow_surface, (x - points_surface.get_width() // 2 + 1, y - offset_y + 1))
-                screen.blit(points_surface, (x - points_surface.get_width() // 2, y - offset_y))
-            else:
-                animations_to_remove.append(i)
-        
-        for i in reversed(animations_to_remove):
-            self.points_animation.pop(i)
+        for tween in self.animations.active:
+            if tween.kind != POINTS: continue
+            text, x, y, color = tween.payload
+            offset_y = tween.value * 60 # Move up 60 pixels
+            alpha = 255 - (tween.t * 255) # Fade out
+
+            # Create animated text with glow effect
+            points_surface = self.text_cache.text(self.medium_font, text, color)
+            # Half as opaque as the text, in a few cached steps
+            glow_alpha = int(alpha // 2) // GLOW_ALPHA_STEP * GLOW_ALPHA_STEP
+            glow_surface = self.text_cache.text(self.medium_font, text, (255, 255, 255), glow_alpha)
+            screen.blit(glow_surface, (x - points_surface.get_width() // 2 + 1, y - offset_y + 1))
+            screen.blit(points_surface, (x - points_surface.get_width() // 2, y - offset_y))
+
+    def draw_bottles(self, screen):
+        sprites = self.bottle_sprites
+        screen.blits([(sprites.get(bottle.sprite_key()), bottle.draw_rect(), None, pygame.BLEND_PREMULTIPLIED) for bottle in self.bottles], False)
+
+        # Selection pulses: a ring that spreads out from the bottle and thins
+        for tween in self.animations.active:
+            if tween.kind != PULSE: continue
+            growth = round(PULSE_GROWTH * tween.value)
+            rect = self.bottles[tween.payload].draw_rect().inflate(2 * growth, 2 * growth)
+            pygame.draw.rect(screen, ACCENT_COLOR, rect, max(1, round(3 * (1 - tween.t))), border_radius=15 + growth)
+
+    def pour_arc(self, from_index, to_index):
+        """Screen positions a pour travels through, and the radius of its liquid"""
+        from_bottle = self.bottles[from_index]
+        to_bottle = self.bottles[to_index]
+
+        # Calculate start and end points for pouring liquid
+        start_x = from_bottle.rect.centerx
+        start_y = from_bottle.rect.bottom - (from_bottle.get_top_color_count() * from_bottle.segment_height())
+
+        end_x = to_bottle.rect.centerx
+        end_y = to_bottle.rect.bottom - (len(to_bottle.content) * to_bottle.segment_height())
+
+        # Create a parabolic arc for more realistic pouring
+        scale = from_bottle.rect.width / BOTTLE_WIDTH
+        mid_x = (start_x + end_x) / 2
+        mid_y = min(start_y, end_y) - 50 * scale  # Arc height
+
+        return quadratic_arc((start_x, start_y), (mid_x, mid_y), (end_x, end_y)), max(3, round(12 * scale))
 
     def draw_pouring_animation(self, screen):
-        if self.pouring_animation:
-            from_idx, to_idx, segments_to_pour, color_to_pour, start_time = self.pouring_animation
-            elapsed_time = pygame.time.get_ticks() - start_time
-            duration = 800 # milliseconds
-
-            if elapsed_time < duration:
-                progress = elapsed_time / duration
-                
-                from_bottle = self.bottles[from_idx]
-                to_bottle = self.bottles[to_idx]
-
-                # Calculate start and end points for pouring liquid
-                start_x = from_bottle.rect.centerx
-                start_y = from_bottle.rect.y + BOTTLE_HEIGHT - (from_bottle.get_top_color_count() * LIQUID_SEGMENT_HEIGHT)
-
-                end_x = to_bottle.rect.centerx
-                end_y = to_bottle.rect.y + BOTTLE_HEIGHT - (len(to_bottle.content) * LIQUID_SEGMENT_HEIGHT)
-
-                # Create a parabolic arc for more realistic pouring
-                mid_x = (start_x + end_x) / 2
-                mid_y = min(start_y, end_y) - 50  # Arc height
-                
-                # Quadratic Bezier curve
-                t = progress
-                current_x = (1-t)**2 * start_x + 2*(1-t)*t * mid_x + t**2 * end_x
-                current_y = (1-t)**2 * start_y + 2*(1-t)*t * mid_y + t**2 * end_y
-
-                # Draw pouring liquid with trail effect
-                pour_radius = 12
-                trail_length = 5
-                for i in range(trail_length):
-                    trail_t = max(0, t - i * 0.05)
-                    trail_x = (1-trail_t)**2 * start_x + 2*(1-trail_t)*trail_t * mid_x + trail_t**2 * end_x
-                    trail_y = (1-trail_t)**2 * start_y + 2*(1-trail_t)*trail_t * mid_y + trail_t**2 * end_y
-                    trail_alpha = 255 - (i * 50)
-                    trail_color = (*LIQUID_COLORS[color_to_pour], trail_alpha)
-                    trail_surface = pygame.Surface((pour_radius * 2, pour_radius * 2), pygame.SRCALPHA)
-                    pygame.draw.circle(trail_surface, trail_color, (pour_radius, pour_radius), pour_radius - i)
-                    screen.blit(trail_surface, (int(trail_x) - pour_radius, int(trail_y) - pour_radius))
-            else:
-                # Animation finished, clear the animation state
-                self.pouring_animation = None
+        blits = []
+        for tween in self.animations.active:
+            if tween.kind != POUR: continue
+            arc, trail = tween.payload[4:]
+            head = tween.value * ARC_STEPS
+
+            # Draw pouring liquid with trail effect, tail first so the head stays on top
+            for i in range(len(trail) - 1, -1, -1):
+                step = int(head - i * TRAIL_SPACING)
+                if step < 0: continue
+                sprite, radius = trail[i]
+                x, y = arc[step]
+                blits.append((sprite, (x - radius, y - radius)))
+        if blits:
+            screen.blits(blits, False)
 
     def show_win_modal(self):
         self.win_modal_active = True
+        self.dirty.mark_all()
+
+    def hide_win_modal(self):
+        self.win_modal_active = False
+        self.dirty.mark_all()
 
     def draw_win_modal(self, screen):
         if not self.win_modal_active:
@@ -567,17 +693,17 @@ class WaterSortGame:
         draw_glassmorphism_rect(screen, modal_rect, alpha=150, border_alpha=200, border_radius=25)
 
         # Title
-        title_text = self.large_font.render("Congratulations!", True, SUCCESS_COLOR)
+        title_text = self.text_cache.text(self.large_font, "Congratulations!", SUCCESS_COLOR)
         screen.blit(title_text, (modal_x + (modal_width - title_text.get_width()) // 2, modal_y + 30))
 
         # Message
         message_lines = [
             f"Puzzle solved in {self.moves} moves!",
             f"Score: {self.score}",
-            f"Level Progress: {self.level_progresses[self.current_level]}%"
+            f"Level Progress: {self.level_progress()}%"
         ]
         for i, line in enumerate(message_lines):
-            line_surface = self.medium_font.render(line, True, ON_SURFACE_COLOR)
+            line_surface = self.text_cache.text(self.medium_font, line, ON_SURFACE_COLOR)
             screen.blit(line_surface, (modal_x + (modal_width - line_surface.get_width()) // 2, modal_y + 100 + i * 35))
 
         # Buttons
@@ -585,96 +711,298 @@ class WaterSortGame:
         close_modal_btn_rect = pygame.Rect(modal_x + modal_width - 200, modal_y + modal_height - 70, 140, 45)
 
         pygame.draw.rect(screen, PRIMARY_COLOR, new_game_btn_rect, border_radius=22)
-        new_game_text = self.font.render("New Game", True, (255, 255, 255))
+        new_game_text = self.text_cache.text(self.font, "New Game", (255, 255, 255))
         screen.blit(new_game_text, (new_game_btn_rect.x + (new_game_btn_rect.width - new_game_text.get_width()) // 2, new_game_btn_rect.y + (new_game_btn_rect.height - new_game_text.get_height()) // 2))
 
         pygame.draw.rect(screen, ERROR_COLOR, close_modal_btn_rect, border_radius=22)
-        close_text = self.font.render("Close", True, (255, 255, 255))
+        close_text = self.text_cache.text(self.font, "Close", (255, 255, 255))
         screen.blit(close_text, (close_modal_btn_rect.x + (close_modal_btn_rect.width - close_text.get_width()) // 2, close_modal_btn_rect.y + (close_modal_btn_rect.height - close_text.get_height()) // 2))
 
         self.new_game_btn_rect = new_game_btn_rect # Store for click detection
         self.close_modal_btn_rect = close_modal_btn_rect # Store for click detection
 
+    def update(self):
+        """One fixed simulation step: replay input, hint delivery and animation clocks"""
+        self.sim_time += UPDATE_STEP_MS
+        if self.replay_records:
+            self.update_replay()
+        self.poll_hint()
+        self.animations.update(self.sim_time)
+
+    def advance(self, now):
+        """Run the update steps due by ``now`` (wall-clock ms); returns how many ran"""
+        steps = max(0, (now - self.sim_time) // UPDATE_STEP_MS)
+        if steps:
+            # Whatever finishes in these steps is erased by the next render
+            self.mark_animations()
+        if steps > MAX_FRAMESKIP:
+            # Too far behind to replay step by step; tweens are timed, so
+            # they still finish when they should
+            self.sim_time += (steps - MAX_FRAMESKIP) * UPDATE_STEP_MS
+            steps = MAX_FRAMESKIP
+        for _ in range(steps):
+            self.update()
+        self.update_lag = max(0, now - self.sim_time)
+        return steps
+
+    def begin_frame(self):
+        """Start a frame and return the screen regions that need repainting"""
+        # Every dirty region of a frame is drawn at the same animation time:
+        # the last update step plus the wall-clock time since, so motion stays
+        # smooth between steps
+        self.frame_time = self.sim_time + self.update_lag
+        if self.show_profiler and self.frame_time - self.profiler_overlay_time >= PROFILER_REFRESH_MS:
+            self.update_profiler_overlay()
+        self.mark_animations()
+        self.animations.sample(self.frame_time)
+        return self.dirty.pop()
+
+    def draw_frame(self, screen):
+        profiler = self.profiler
+        with profiler.stage('background'):
+            self.draw_background(screen)
+        with profiler.stage('draw_ui'):
+            self.draw_ui(screen)
+        with profiler.stage('bottles'):
+            self.draw_bottles(screen)
+        with profiler.stage('pouring_animation'):
+            self.draw_pouring_animation(screen)
+        with profiler.stage('win_modal'):
+            self.draw_win_modal(screen)
+
+        if self.show_profiler:
+            screen.blit(self.profiler_overlay, (8, 8))
+
+    def render_dirty(self, screen):
+        """Redraw only the regions touched since the last frame and return them"""
+        dirty_rects = self.begin_frame()
+        for rect in dirty_rects:
+            screen.set_clip(rect)
+            self.draw_frame(screen)
+        screen.set_clip(None)
+        return dirty_rects
+
+    def toggle_profiler(self):
+        self.show_profiler = not self.show_profiler
+        self.profiler.enabled = self.show_profiler or self.profiler.record
+        if self.show_profiler:
+            self.update_profiler_overlay()
+        else:
+            self.dirty.mark(self.profiler_overlay.get_rect(topleft=(8, 8)))
+
+    def update_profiler_overlay(self):
+        # Rebuilt a few times a second, not every frame
+        self.profiler_overlay_time = self.frame_time
+        lines = ["stage               p50    p95    p99 ms"]
+        for name, (p50, p95, p99) in self.profiler.summary().items():
+            lines.append(f"{name:<18}{p50:>6.2f} {p95:>6.2f} {p99:>6.2f}")
+        line_height = self.small_font.get_linesize()
+        overlay = pygame.Surface((300, 10 + line_height * len(lines)), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            overlay.blit(self.small_font.render(line, True, (255, 255, 255)), (8, 5 + i * line_height))
+
+        if self.profiler_overlay is not None:
+            self.dirty.mark(self.profiler_overlay.get_rect(topleft=(8, 8)))
+        self.profiler_overlay = overlay
+        self.dirty.mark(overlay.get_rect(topleft=(8, 8)))
+
+    def start_replay(self, records, speed=1.0):
+        self.replay_records = deque(records)
+        self.replay_speed = speed
+        self.replay_start = self.sim_time
+
+    def replay_due_in(self):
+        """Milliseconds of simulation time until the next replay record is due"""
+        elapsed = self.sim_time - self.replay_start
+        return self.replay_records[0][1] / self.replay_speed - elapsed
+
+    def update_replay(self):
+        # Play every record whose time has come, as the player's input did
+        while self.replay_records and self.replay_due_in() <= 0:
+            kind, _, payload = self.replay_records.popleft()
+            if kind == HINT:
+                # Show the recorded hint instead of running the solver again
+                self.hint_move = payload if payload != (NO_HINT, NO_HINT) else None
+            else:
+                if kind == GAME and self.win_modal_active:
+                    self.hide_win_modal()
+                message = apply_record(self, kind, payload)
+                if message:
+                    print("Replay mismatch:", message)
+            self.sync_bottle_flags()
+
+    def is_animating(self):
+        return bool(self.animations)
+
+    def next_wakeup(self):
+        """Milliseconds until something scheduled needs a frame, or None"""
+        wakeups = []
+        if self.show_profiler:
+            wakeups.append(PROFILER_REFRESH_MS - (pygame.time.get_ticks() - self.profiler_overlay_time))
+        if self.replay_records:
+            wakeups.append(self.replay_due_in() - self.update_lag)
+        if self.hint_worker.ready:
+            # Delivered by the next update step
+            wakeups.append(UPDATE_STEP_MS - self.update_lag)
+        return int(min(wakeups)) if wakeups else None
+
+    def wait_for_events(self, clock):
+        if self.idle_sleep and not self.is_animating() and not self.dirty:
+            # Idle board: sleep until input arrives or a scheduled tick is due
+            timeout = self.next_wakeup()
+            event = pygame.event.wait() if timeout is None else pygame.event.wait(max(1, timeout))
+            clock.tick() # Don't count the idle time against the next frame
+            events = [] if event.type == pygame.NOEVENT else [event]
+            return events + pygame.event.get()
+
+        clock.tick(self.fps)
+        return pygame.event.get()
+
     def run(self):
+        # Mouse motion is never used; keep it from waking the idle loop
+        pygame.event.set_blocked(pygame.MOUSEMOTION)
+        clock = pygame.time.Clock()
         running = True
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1: # Left click
-                        if self.win_modal_active:
-                            if self.new_game_btn_rect.collidepoint(event.pos):
-                                self.new_game()
-                                self.win_modal_active = False
-                            elif self.close_modal_btn_rect.collidepoint(event.pos):
-                                self.win_modal_active = False
-                                running = False # Optionally close game
-                        else:
-                            # Check button clicks
-                            button_y = 100 # Adjusted button_y
-                            button_width = 120
-                            button_height = 40
-                            button_gap = 10
-                            total_button_width = 3 * button_width + 2 * button_gap
-                            start_button_x = (SCREEN_WIDTH - total_button_width) // 2
-
-                            start_button_rect = pygame.Rect(start_button_x, button_y, button_width, button_height)
-                            new_game_button_rect = pygame.Rect(start_button_x + button_width + button_gap, button_y, button_width, button_height)
-                            hint_button_rect = pygame.Rect(start_button_x + 2 * (button_width + button_gap), button_y, button_width, button_height)
-
-                            if start_button_rect.collidepoint(event.pos):
-                                self.start_game()
-                            elif new_game_button_rect.collidepoint(event.pos):
-                                self.new_game()
-                            elif hint_button_rect.collidepoint(event.pos):
-                                self.show_hint()
-                            elif hasattr(self, 'easy_level_rect') and self.easy_level_rect.collidepoint(event.pos):
-                                self.set_level('easy')
-                            elif hasattr(self, 'medium_level_rect') and self.medium_level_rect.collidepoint(event.pos):
-                                self.set_level('medium')
-                            elif hasattr(self, 'hard_level_rect') and self.hard_level_rect.collidepoint(event.pos):
-                                self.set_level('hard')
-                            else:
-                                self.handle_click(event.pos)
-
-            # Drawing
-            # Background gradient (modern Android-like with multiple color stops)
-            for y in range(SCREEN_HEIGHT):
-                if y < SCREEN_HEIGHT * 0.3:
-                    # Top section: Light purple to blue
-                    ratio = y / (SCREEN_HEIGHT * 0.3)
-                    color_start = (230, 220, 255)  # Light purple
-                    color_end = (200, 230, 255)    # Light blue
-                elif y < SCREEN_HEIGHT * 0.7:
-                    # Middle section: Light blue to light green
-                    ratio = (y - SCREEN_HEIGHT * 0.3) / (SCREEN_HEIGHT * 0.4)
-                    color_start = (200, 230, 255)  # Light blue
-                    color_end = (220, 255, 230)    # Light green
-                else:
-                    # Bottom section: Light green to light yellow
-                    ratio = (y - SCREEN_HEIGHT * 0.7) / (SCREEN_HEIGHT * 0.3)
-                    color_start = (220, 255, 230)  # Light green
-                    color_end = (255, 250, 220)    # Light yellow
-
-                r = int(color_start[0] + (color_end[0] - color_start[0]) * ratio)
-                g = int(color_start[1] + (color_end[1] - color_start[1]) * ratio)
-                b = int(color_start[2] + (color_end[2] - color_start[2]) * ratio)
-                
-                pygame.draw.line(SCREEN, (r, g, b), (0, y), (SCREEN_WIDTH, y))
-
-            self.draw_ui(SCREEN)
-            for bottle in self.bottles:
-                bottle.draw(SCREEN)
-            
-            self.draw_pouring_animation(SCREEN)
-            self.draw_win_modal(SCREEN)
-
-            pygame.display.flip()
-
+            events = self.wait_for_events(clock)
+            self.profiler.begin_frame()
+            # Catch the simulation up first, so input lands at the current time
+            # even after a slow frame
+            with self.profiler.stage('update'):
+                self.advance(pygame.time.get_ticks())
+            with self.profiler.stage('events'):
+                running = self.handle_events(events)
+
+            dirty_rects = self.render_dirty(self.screen)
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
+            self.profiler.end_frame()
+
+        if self.profile_dump:
+            self.profiler.dump(self.profile_dump)
+        if self.recorder is not None:
+            self.record_end()
+            self.recorder.close()
+        self.hint_worker.close()
+        if self.store is not None:
+            self.store.close() # Finishes any write still queued
         pygame.quit()
 
-if __name__ == '__main__':
-    game = WaterSortGame()
+    def handle_events(self, events):
+        """Process one batch of events; returns False once the game should quit"""
+        running = True
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.toggle_profiler()
+            if (event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL and not self.win_modal_active
+                    and not self.replay_records):
+                if (event.key == pygame.K_z and event.mod & pygame.KMOD_SHIFT) or event.key == pygame.K_y:
+                    self.redo()
+                elif event.key == pygame.K_z:
+                    self.undo()
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.dirty.mark_all()
+            if event.type == pygame.MOUSEBUTTONDOWN and not self.replay_records:
+                if event.button == 1: # Left click
+                    if self.win_modal_active:
+                        if self.new_game_btn_rect.collidepoint(event.pos):
+                            self.new_game()
+                            self.hide_win_modal()
+                        elif self.close_modal_btn_rect.collidepoint(event.pos):
+                            self.hide_win_modal()
+                            running = False # Optionally close game
+                    else:
+                        # Check button clicks
+                        button_y = 100 # Adjusted button_y
+                        button_width = 120
+                        button_height = 40
+                        button_gap = 10
+                        total_button_width = 3 * button_width + 2 * button_gap
+                        start_button_x = (SCREEN_WIDTH - total_button_width) // 2
+
+                        start_button_rect = pygame.Rect(start_button_x, button_y, button_width, button_height)
+                        new_game_button_rect = pygame.Rect(start_button_x + button_width + button_gap, button_y, button_width, button_height)
+                        hint_button_rect = pygame.Rect(start_button_x + 2 * (button_width + button_gap), button_y, button_width, button_height)
+
+                        if start_button_rect.collidepoint(event.pos):
+                            self.start_game()
+                        elif new_game_button_rect.collidepoint(event.pos):
+                            self.new_game()
+                        elif hint_button_rect.collidepoint(event.pos):
+                            self.show_hint()
+                        elif hasattr(self, 'easy_level_rect') and self.easy_level_rect.collidepoint(event.pos):
+                            self.set_level('easy')
+                        elif hasattr(self, 'medium_level_rect') and self.medium_level_rect.collidepoint(event.pos):
+                            self.set_level('medium')
+                        elif hasattr(self, 'hard_level_rect') and self.hard_level_rect.collidepoint(event.pos):
+                            self.set_level('hard')
+                        elif hasattr(self, 'custom_level_rect') and self.custom_level_rect.collidepoint(event.pos):
+                            self.set_level('custom')
+                        else:
+                            self.handle_click(event.pos)
+        return running
+
+def parse_capacity(text):
+    """``--capacity`` value: one bottle size ("5") or a range for mixed sizes ("3-6")"""
+    try:
+        low, _, high = text.partition('-')
+        capacity = (int(low), int(high)) if high else int(low)
+        capacity_range(capacity)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return capacity
+
+def parse_replay_speed(text):
+    """``--replay-speed`` value: a finite multiplier above zero"""
+    try:
+        speed = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number: {text!r}")
+    if not (speed > 0 and math.isfinite(speed)):
+        raise argparse.ArgumentTypeError(f"must be a number above 0, not {text}")
+    return speed
+
+def main():
+    parser = argparse.ArgumentParser(description="Water Sort Puzzle")
+    parser.add_argument('--fps', type=int, default=60, help="frame-rate cap while animating (0 = uncapped)")
+    parser.add_argument('--profile', action='store_true', help="show the frame timing overlay (toggle with F3)")
+    parser.add_argument('--profile-dump', metavar='PATH', help="write per-frame timings to a .csv or .json file on exit")
+    parser.add_argument('--scores', metavar='PATH', default=DEFAULT_PATH, help="file that keeps high scores and level progress (unused with --replay)")
+    parser.add_argument('--record', metavar='PATH', help="record the session to a binary replay log")
+    parser.add_argument('--replay', metavar='PATH', help="play back a replay log")
+    parser.add_argument('--replay-speed', type=parse_replay_speed, default=1.0, help="playback speed multiplier for --replay")
+    parser.add_argument('--level', choices=LEVELS, default='easy', help="level to start on")
+    parser.add_argument('--bottles', type=int, default=DEFAULT_CUSTOM_BOTTLES,
+                        help=f"bottles on a custom level board ({CUSTOM_BOTTLES_RANGE[0]}-{CUSTOM_BOTTLES_RANGE[1]})")
+    parser.add_argument('--capacity', type=parse_capacity, default=4, metavar='N|LOW-HIGH',
+                        help=f"segments per bottle ({MIN_CAPACITY}-{MAX_CAPACITY}), or a range to mix bottle sizes")
+    args = parser.parse_args()
+    if not CUSTOM_BOTTLES_RANGE[0] <= args.bottles <= CUSTOM_BOTTLES_RANGE[1]:
+        parser.error(f"--bottles must be between {CUSTOM_BOTTLES_RANGE[0]} and {CUSTOM_BOTTLES_RANGE[1]}")
+    try:
+        records = load_records(args.replay) if args.replay else None
+    except (OSError, ReplayError) as e:
+        parser.error(f"can't replay {args.replay}: {e}")
+
+    # Initialize Pygame
+    pygame.init()
+    # pygame.mixer.init() # Initialize mixer for sounds
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Water Sort Puzzle v0.1.13 - almezali")
+
+    recorder = ReplayRecorder(open(args.record, 'wb')) if args.record else None
+    # A replayed session plays someone else's games, so it neither reads nor writes the scores file
+    store = None if args.replay else ScoreStore(args.scores)
+    game = WaterSortGame(screen, fps=args.fps, show_profiler=args.profile, profile_dump=args.profile_dump,
+                         recorder=recorder, store=store, level=args.level, custom_bottles=args.bottles,
+                         capacity=args.capacity)
+    if records:
+        game.start_replay(records, args.replay_speed)
     game.run()
 
+if __name__ == '__main__':
+    main()
+